@@ -0,0 +1,270 @@
+"""Measure the per-run overhead of ipytest
+
+Each benchmark is executed for synthetic notebook modules of different sizes,
+i.e., modules with the given number of tests. The results are written as JSON
+to stdout or to the file given by `--output`. A human readable summary is
+printed to stderr.
+
+Usage:
+
+```bash
+python benchmarks/bench_ipytest.py
+python benchmarks/bench_ipytest.py --sizes 10,100 --output results.json
+python benchmarks/bench_ipytest.py --filter clean
+```
+"""
+
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import pathlib
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+# benchmark the source tree, not an installed version of ipytest
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.resolve()))
+
+import pytest
+
+import ipytest
+from ipytest import _impl
+
+default_sizes = (10, 100, 1_000, 10_000)
+benchmarks = {}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in default_sizes),
+        help="comma separated number of tests in the synthetic modules",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", help="only run benchmarks containing this string")
+    parser.add_argument("--output", help="the file to write the results to")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmpdir, chdir(tmpdir):
+        for name, func in benchmarks.items():
+            if args.filter is not None and args.filter not in name:
+                continue
+
+            for size in sizes:
+                for variant, timings in func(size, args.repeat).items():
+                    result = summarize(name, variant, size, timings)
+                    print(
+                        f"{name:20s} {variant:10s} {size:6d} "
+                        f"min={result['min'] * 1e3:10.3f}ms "
+                        f"median={result['median'] * 1e3:10.3f}ms",
+                        file=sys.stderr,
+                    )
+                    results.append(result)
+
+    report = {
+        "python": platform.python_version(),
+        "pytest": pytest.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    else:
+        with open(args.output, "wt") as fobj:
+            json.dump(report, fobj, indent=2)
+
+
+def benchmark(func):
+    benchmarks[func.__name__.removeprefix("bench_")] = func
+    return func
+
+
+@benchmark
+def bench_run(size, repeat):
+    """The overhead of `ipytest.run()` over bare `pytest.main`"""
+    source = make_test_source(size)
+    module = make_module(source)
+
+    # NOTE: use a new module per size, as pytest reuses imported modules
+    path = pathlib.Path(f"test_bench_run_{size}.py")
+    path.write_text(source)
+
+    try:
+        args = ["-qq", "-p", "no:cacheprovider"]
+        return {
+            "pytest": measure(
+                lambda: pytest.main([*args, str(path)]),
+                repeat=repeat,
+                quiet=True,
+            ),
+            "ipytest": measure(
+                lambda: ipytest.run(*args, module=module),
+                repeat=repeat,
+                quiet=True,
+            ),
+        }
+
+    finally:
+        path.unlink()
+        sys.modules.pop(path.stem, None)
+
+
+@benchmark
+def bench_prepared_env(size, repeat):
+    """Setup and teardown of the environment of a run"""
+    module = make_module(make_test_source(size))
+
+    def prepare_env():
+        with _impl._prepared_env(module, display_columns=100, buffer_output=False):
+            pass
+
+    return {"default": measure(prepare_env, repeat=repeat)}
+
+
+@benchmark
+def bench_clean(size, repeat):
+    """Cleaning a namespace with the given number of tests and 10x as many other globals"""
+    source = make_test_source(size) + "".join(
+        f"value_{idx} = {idx}\n" for idx in range(10 * size)
+    )
+
+    return {
+        "default": measure(
+            lambda module: ipytest.clean(module=module),
+            setup=lambda: make_module(source),
+            repeat=repeat,
+        ),
+    }
+
+
+@benchmark
+def bench_rewrite_asserts(size, repeat):
+    """Assertion rewriting of a cell containing the given number of tests"""
+    source = make_test_source(size)
+    lines = source.splitlines(keepends=True)
+
+    def rewrite(transformer):
+        transformer.record_source(lines)
+        transformer.visit(ast.parse(source))
+
+    cached_transformer = _impl.RewriteAssertTransformer()
+    rewrite(cached_transformer)
+
+    return {
+        "uncached": measure(
+            rewrite,
+            setup=_impl.RewriteAssertTransformer,
+            repeat=repeat,
+        ),
+        "cached": measure(lambda: rewrite(cached_transformer), repeat=repeat),
+    }
+
+
+@benchmark
+def bench_eval_run_kwargs(size, repeat):
+    """Parsing the run options of a cell with the given number of tests"""
+    cell = "# ipytest: defopts=False, display_columns=80\n" + make_test_source(size)
+    module = make_module("")
+
+    return {
+        "default": measure(
+            lambda: _impl.eval_run_kwargs(cell, module=module),
+            repeat=repeat,
+        ),
+    }
+
+
+@benchmark
+def bench_run_func(size, repeat):
+    """Executing the given number of functions directly or in a thread"""
+
+    def run_many(run_func):
+        for _ in range(size):
+            run_func(int)
+
+    return {
+        "direct": measure(lambda: run_many(_impl.run_func_direct), repeat=repeat),
+        "thread": measure(lambda: run_many(_impl.run_func_in_thread), repeat=repeat),
+    }
+
+
+def make_test_source(size):
+    return "".join(
+        f"def test_{idx}():\n    value = {idx}\n    assert value == {idx}\n\n"
+        for idx in range(size)
+    )
+
+
+def make_module(source):
+    module = types.ModuleType("bench_module")
+    exec(source, module.__dict__, module.__dict__)
+    return module
+
+
+def measure(func, *, setup=None, repeat, quiet=False):
+    """Measure the execution time of `func`, if given call it with the result of `setup`"""
+    timings = []
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+
+        with redirected_output(quiet):
+            start = time.perf_counter()
+            func(*args)
+            end = time.perf_counter()
+
+        timings.append(end - start)
+
+    return timings
+
+
+def summarize(name, variant, size, timings):
+    return {
+        "benchmark": name,
+        "variant": variant,
+        "size": size,
+        "repeat": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "max": max(timings),
+        "timings": timings,
+    }
+
+
+@contextlib.contextmanager
+def redirected_output(quiet):
+    if not quiet:
+        yield
+        return
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with contextlib.redirect_stderr(io.StringIO()):
+            yield
+
+
+@contextlib.contextmanager
+def chdir(path):
+    prev_cwd = os.getcwd()
+    os.chdir(path)
+
+    try:
+        yield
+
+    finally:
+        os.chdir(prev_cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,31 @@
 from ._config import autoconfig, config
-from ._impl import Error, clean, force_reload, reload, run
+from ._impl import (
+    Error,
+    ResultEvent,
+    ResultEvents,
+    clean,
+    force_reload,
+    reload,
+    run,
+    run_async,
+)
 
 # the pytest exit code
 exit_code = None
 
+# information about the last run, e.g., the duration of its phases
+last_run = None
+
 
 __all__ = [
     "Error",
+    "ResultEvent",
+    "ResultEvents",
     "autoconfig",
     "clean",
     "config",
     "force_reload",
     "reload",
     "run",
+    "run_async",
 ]
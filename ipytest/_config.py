@@ -7,26 +7,46 @@ default_clean = "[Tt]est*"
 
 defaults = {
     "addopts": ("-q", "--color=yes"),
+    "buffer_output": False,
     "clean": default_clean,
     "coverage": False,
     "defopts": "auto",
     "display_columns": 100,
     "magics": True,
+    "only_affected": False,
+    "parallel": False,
+    "profile": False,
     "raise_on_error": False,
+    "reorder": False,
+    "reporter": "terminal",
+    "result_cache": False,
     "rewrite_asserts": True,
     "run_in_thread": False,
+    "session": "fresh",
+    "shard_count": None,
+    "shard_index": None,
 }
 
 current_config = {
     "addopts": (),
+    "buffer_output": False,
     "clean": default_clean,
     "coverage": False,
     "defopts": "auto",
     "display_columns": 100,
     "magics": False,
+    "only_affected": False,
+    "parallel": False,
+    "profile": False,
     "raise_on_error": False,
+    "reorder": False,
+    "reporter": "terminal",
+    "result_cache": False,
     "rewrite_asserts": False,
     "run_in_thread": False,
+    "session": "fresh",
+    "shard_count": None,
+    "shard_index": None,
 }
 
 _rewrite_transformer = None
@@ -71,6 +91,16 @@ def autoconfig(
     display_columns=default,
     raise_on_error=default,
     coverage=default,
+    session=default,
+    parallel=default,
+    profile=default,
+    result_cache=default,
+    only_affected=default,
+    reporter=default,
+    buffer_output=default,
+    shard_index=default,
+    shard_count=default,
+    reorder=default,
 ):
     """Configure `ipytest` with reasonable defaults.
 
@@ -95,7 +125,17 @@ def config(
     defopts=keep,
     display_columns=keep,
     raise_on_error=keep,
-    coverage=default,
+    coverage=keep,
+    session=keep,
+    parallel=keep,
+    profile=keep,
+    result_cache=keep,
+    only_affected=keep,
+    reporter=keep,
+    buffer_output=keep,
+    shard_index=keep,
+    shard_count=keep,
+    reorder=keep,
 ):
     """Configure `ipytest`
 
@@ -123,7 +163,8 @@ def config(
       verbosity. Consider adding `--color=yes` to force color output
     * `run_in_thread` (default: `False`): if `True`, pytest will be run a
       separate thread. This way of running is required when testing async code
-      with `pytest_asyncio` since it starts a separate event loop
+      with `pytest_asyncio` since it starts a separate event loop. The thread
+      and its asyncio event loop are kept alive and reused across runs
     * `defopts` (default: `"auto"`): either `"auto"`, `True` or `False`
       * if `"auto"`, `ipytest` will add the current notebook module to the
         command line arguments, if no pytest node ids that reference the
@@ -137,6 +178,69 @@ def config(
     * `raise_on_error` (default `False` ): if `True`,
       [`ipytest.run`][ipytest.run] and [`%%ipytest`][ipytest.ipytest] will raise
       an `ipytest.Error` if pytest fails.
+    * `session` (default: `"fresh"`): either `"fresh"` or `"persistent"`
+      * if `"fresh"`, every run creates a new pytest config, i.e., plugins,
+        ini files and `conftest.py` files are loaded again
+      * if `"persistent"`, the pytest config is kept alive between runs and
+        only the notebook is collected again. The config is recreated, if the
+        arguments, the plugins or the loaded `conftest.py` and ini files change.
+        Runs that collect coverage always use a fresh config
+    * `parallel` (default: `False`): if not `False`, execute the tests in
+      the given number of forked worker processes (`True` uses one worker per
+      CPU). The workers are forked after collection and inherit the notebook
+      globals without pickling them. Their results are reported by the kernel
+      process. This option requires `os.fork` and is not available on Windows.
+      While coverage is measured, e.g., with `coverage=True`, the tests are
+      executed in the kernel with a warning, as the workers cannot save their
+      coverage data
+    * `profile` (default: `False`): if not `False`, profile each test call with
+      `cProfile` and report the functions with the largest own time for the
+      slowest tests. An integer selects the number of reported tests and
+      functions, `True` reports 10. Functions defined in notebook cells are
+      reported with their cell names (e.g., `In[12]`), if
+      [`ipytest.cov.translate_cell_filenames()`](#ipytestcov) is enabled. The
+      `pstats.Stats` object of each test is stored in
+      [`ipytest.last_run["profile"]`][ipytest.last_run]
+    * `result_cache` (default: `False`): either `False`, `True` or
+      `"persistent"`. If not `False`, tests that passed before are not executed
+      again, if their code, the code and values of the globals they depend on,
+      their fixtures and their parameters did not change. They are reported as
+      `CACHED` passes. Modules in the current directory are identified by the
+      content of their file, dependencies outside the notebook and the current
+      directory are only identified by name. If `"persistent"`, the results are
+      also stored in pytest's cache directory. To force a re-run of all tests,
+      pass `--cache-clear` to pytest
+    * `only_affected` (default: `False`): if `True`, only execute the notebook
+      tests that did not pass before or that are affected by globals rebound
+      since they passed. The globals a test depends on are determined from the
+      names referenced by its code and the notebook functions, classes and
+      fixtures it uses. Modifying objects in-place is not detected
+    * `reporter` (default: `"terminal"`): either `"terminal"` or `"notebook"`.
+      With `"terminal"`, the pytest output is shown as is. With `"notebook"`,
+      the per-test output is replaced by a single progress display that is
+      updated at most twice per second. The summary, including the failures,
+      is shown after the tests finished
+    * `buffer_output` (default: `False`): if `True`, buffer the output written
+      to `sys.stdout` and `sys.stderr` during the run and only forward it, when
+      64 KiB accumulated or 0.5 seconds passed since the last forward. The
+      time is only checked on the next write or flush, output followed by a
+      long running test is shown once more output is written or the run ends.
+      In kernels each forwarded write is a separate message to the frontend,
+      buffering reduces their number for chatty runs
+    * `shard_index`, `shard_count` (default: `None`): if `shard_count` is
+      larger than one, only execute the tests of the shard with the given
+      (zero-based) index. If not given, the values are read from the
+      environment variables `IPYTEST_SHARD_INDEX` and `IPYTEST_SHARD_COUNT`,
+      empty variables are ignored. An index without a count is an error.
+      The tests are balanced over the shards using the durations recorded in
+      pytest's cache directory. For consistent shards, all shards should use the
+      same cache, e.g., restored from a previous CI run. The durations are
+      recorded, whenever a shard count is given, including a count of one
+    * `reorder` (default: `False`): if `True`, execute the tests that failed in
+      the last run of the kernel first, then the remaining tests ordered by
+      their duration in the last run, starting with new tests. Combined with
+      `-x`, failures are reported before slow tests are executed. The tests of
+      a class or module are kept together, to set up their fixtures only once
     """
     args = collect_args()
     new_config = {
@@ -149,6 +253,9 @@ def config(
     if new_config["magics"] != current_config["magics"]:
         configure_magics(new_config["magics"])
 
+    if new_config["session"] != current_config["session"]:
+        configure_session(new_config["session"])
+
     current_config.update(new_config)
     return dict(current_config)
 
@@ -185,6 +292,13 @@ def configure_magics(enable):
         warnings.warn("IPython does not support de-registering magics.")
 
 
+def configure_session(session):
+    from ._impl import close_persistent_session
+
+    if session != "persistent":
+        close_persistent_session()
+
+
 def collect_args():
     frame = inspect.currentframe()
     frame = frame.f_back
@@ -1,22 +1,27 @@
 import ast
+import collections
 import contextlib
+import contextvars
 import fnmatch
+import functools
+import hashlib
 import importlib
 import os
 import pathlib
+import pickle
 import re
 import shlex
 import sys
 import threading
-import uuid
+import time
 from types import ModuleType
 from typing import Any, Dict, Mapping, Optional, Sequence
 
-import packaging.version
-import pytest
-
 from ._config import current_config, default
 
+# NOTE: pytest, packaging and IPython are imported lazily to keep the import of
+# ipytest cheap. Pytest plugins and collectors are defined in `._plugins`.
+
 RANDOM_MODULE_PATH_RETRIES = 10
 
 
@@ -30,6 +35,16 @@ def run(
     defopts=default,
     display_columns=default,
     coverage=default,
+    session=default,
+    parallel=default,
+    profile=default,
+    result_cache=default,
+    only_affected=default,
+    reporter=default,
+    buffer_output=default,
+    shard_index=default,
+    shard_count=default,
+    reorder=default,
 ):
     """Execute all tests in the passed module (defaults to `__main__`) with pytest.
 
@@ -56,6 +71,17 @@ def run(
     - `addopts`: if given, override the config option "addopts".
     - `defopts`: if given, override the config option "defopts".
     - `display_columns`: if given, override the config option "display_columns".
+    - `coverage`: if given, override the config option "coverage".
+    - `session`: if given, override the config option "session".
+    - `parallel`: if given, override the config option "parallel".
+    - `profile`: if given, override the config option "profile".
+    - `result_cache`: if given, override the config option "result_cache".
+    - `only_affected`: if given, override the config option "only_affected".
+    - `reporter`: if given, override the config option "reporter".
+    - `buffer_output`: if given, override the config option "buffer_output".
+    - `shard_index`: if given, override the config option "shard_index".
+    - `shard_count`: if given, override the config option "shard_count".
+    - `reorder`: if given, override the config option "reorder".
 
     **Returns**: the exit code of `pytest.main`.
     """
@@ -67,23 +93,71 @@ def run(
     defopts = default.unwrap(defopts, current_config["defopts"])
     display_columns = default.unwrap(display_columns, current_config["display_columns"])
     coverage = default.unwrap(coverage, current_config["coverage"])
+    session = default.unwrap(session, current_config["session"])
+    parallel = default.unwrap(parallel, current_config["parallel"])
+    profile = default.unwrap(profile, current_config["profile"])
+    result_cache = default.unwrap(result_cache, current_config["result_cache"])
+    only_affected = default.unwrap(only_affected, current_config["only_affected"])
+    reporter = default.unwrap(reporter, current_config["reporter"])
+    buffer_output = default.unwrap(buffer_output, current_config["buffer_output"])
+    shard_index = default.unwrap(shard_index, current_config["shard_index"])
+    shard_count = default.unwrap(shard_count, current_config["shard_count"])
+    reorder = default.unwrap(reorder, current_config["reorder"])
+
+    if result_cache not in {False, True, "persistent"}:
+        raise ValueError(
+            f"Unknown result cache mode {result_cache!r}, expected False, True, "
+            "or 'persistent'",
+        )
+
+    shard = _get_shard(shard_index, shard_count)
+
+    if reporter not in {"terminal", "notebook"}:
+        raise ValueError(
+            f"Unknown reporter {reporter!r}, expected 'terminal' or 'notebook'",
+        )
+
+    if session not in {"fresh", "persistent"}:
+        raise ValueError(
+            f"Unknown session mode {session!r}, expected 'fresh' or 'persistent'",
+        )
+
+    if parallel and not hasattr(os, "fork"):
+        raise RuntimeError("Parallel test execution requires os.fork")
 
     if module is None:
         import __main__ as module
 
-    run = run_func_in_thread if run_in_thread else run_func_direct
+    last_run = {"exit_code": None, "timings": {}}
+
+    # NOTE: runs share global state, e.g., the module filename or sys.stdout,
+    # queue the run after any pending background runs
+    run = run_func_in_thread if run_in_thread or _background_runs else run_func_direct
     exit_code = run(
         _run_impl,
         *args,
         module=module,
         plugins=plugins,
+        last_run=last_run,
         addopts=addopts,
         defopts=defopts,
         display_columns=display_columns,
         coverage=coverage,
+        session=session,
+        parallel=parallel,
+        profile=profile,
+        result_cache=result_cache,
+        only_affected=only_affected,
+        reporter=reporter,
+        buffer_output=buffer_output,
+        shard=shard,
+        reorder=reorder,
     )
 
+    last_run["exit_code"] = exit_code
+
     ipytest.exit_code = exit_code
+    ipytest.last_run = last_run
 
     if raise_on_error is True and exit_code != 0:
         raise Error(exit_code)
@@ -91,6 +165,117 @@ def run(
     return exit_code
 
 
+def _get_shard(index, count):
+    """Get the shard as a tuple `(index, count)` or `None` if not sharded"""
+    # NOTE: CI templates often set unused variables to empty strings
+    if count is None:
+        count = os.environ.get("IPYTEST_SHARD_COUNT", "").strip() or None
+
+    if index is None:
+        index = os.environ.get("IPYTEST_SHARD_INDEX", "").strip() or None
+
+    if count is None:
+        if index is not None:
+            raise ValueError(
+                f"Invalid shard index {index!r} without shard count, set "
+                "shard_count or IPYTEST_SHARD_COUNT",
+            )
+
+        return None
+
+    try:
+        index, count = int(index if index is not None else 0), int(count)
+
+    except ValueError:
+        raise ValueError(
+            f"Invalid shard index {index!r} or shard count {count!r}, expected "
+            "integers",
+        ) from None
+
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(
+            f"Invalid shard index {index} for shard count {count}, expected "
+            "0 <= shard_index < shard_count",
+        )
+
+    return index, count
+
+
+def run_async(*args, module=None, **kwargs):
+    """Execute the tests in the background and return a future of the exit code
+
+    The tests are executed in the thread also used for `run_in_thread=True`.
+    The kernel stays responsive while the tests run. Runs are executed one
+    after the other. The output of pytest is streamed into the output of the
+    cell that started the run, as the tests finish. When the run is done,
+    [`ipytest.exit_code`][ipytest.exit_code] is set.
+
+    The arguments are the same as for [`ipytest.run()`][ipytest.run], except
+    for `run_in_thread`. Config options are evaluated, when the run starts. If
+    `raise_on_error` is `True` and the tests fail, the future raises an
+    [`ipytest.Error`][ipytest.Error]. To await the result inside a notebook,
+    use `await asyncio.wrap_future(future)`.
+
+    While background runs are pending, [`ipytest.run()`][ipytest.run] and
+    [`ipytest.clean()`][ipytest.clean] wait for them to finish, as runs share
+    global state, e.g., `sys.stdout`.
+
+    Pytest's output capturing is disabled by default, as it would also capture
+    the output of other cells executed while the tests run. To enable it,
+    pass `--capture=fd` as an argument or in `addopts`. Any capture option in
+    the arguments or in `addopts`, including `-s`, is kept as given.
+
+    **NOTE:** notebook globals used by the tests should not be modified while
+    the tests run in the background.
+
+    **Returns**: a `concurrent.futures.Future` of the exit code.
+    """
+    if "run_in_thread" in kwargs:
+        raise TypeError("run_async() does not support the run_in_thread argument")
+
+    if module is None:
+        import __main__ as module
+
+    future = submit_in_thread(_run_async_impl, *args, module=module, **kwargs)
+    _background_runs.add(future)
+    future.add_done_callback(_background_runs.discard)
+    return future
+
+
+def _run_async_impl(*args, addopts=default, **kwargs):
+    addopts = default.unwrap(addopts, current_config["addopts"])
+
+    # NOTE: pytest's capturing replaces the global output streams, it would
+    # capture the output of all cells executed while the tests run
+    if not _has_capture_option([*addopts, *args]):
+        args = ("--capture=no", *args)
+
+    return run(*args, addopts=addopts, run_in_thread=False, **kwargs)
+
+
+# short options of pytest that take a value, e.g., `-k` in `-ks`
+_SHORT_OPTIONS_WITH_VALUE = "ckmnoprW"
+
+
+def _has_capture_option(args):
+    for arg in args:
+        if arg == "--":
+            break
+
+        if arg == "--capture" or arg.startswith("--capture="):
+            return True
+
+        if arg.startswith("-") and not arg.startswith("--"):
+            for flag in arg[1:]:
+                if flag == "s":
+                    return True
+
+                if flag in _SHORT_OPTIONS_WITH_VALUE:
+                    break
+
+    return False
+
+
 class Error(RuntimeError):
     """Error raised by ipytest on test failure"""
 
@@ -101,6 +286,90 @@ class Error(RuntimeError):
         return f"ipytest failed with exit_code {self.args[0]}"
 
 
+ResultEvent = collections.namedtuple(
+    "ResultEvent", ["nodeid", "outcome", "duration", "cell"]
+)
+
+
+class ResultEvents:
+    """A pytest plugin to call a function for each finished test
+
+    Usage:
+
+    ```python
+    failed = []
+
+    def on_result(event):
+        if event.outcome in {"failed", "error"}:
+            failed.append(event.nodeid)
+
+    ipytest.run(plugins=[ipytest.ResultEvents(on_result)])
+    ```
+
+    The callback is called with an `ipytest.ResultEvent` named tuple as soon as
+    a test finished. Reports are not retained, only the event of the current
+    test is kept. The event has the fields:
+
+    - `nodeid`: the node id of the test
+    - `outcome`: one of `"passed"`, `"failed"`, `"error"` (if the setup or
+      teardown failed), `"skipped"`, `"xfailed"`, `"xpassed"`
+    - `duration`: the duration of setup, call and teardown in seconds
+    - `cell`: the filename of the cell the test was defined in or `None` for
+      tests not defined in the notebook
+
+    If the callback returns `True`, the run is stopped after the current test.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._session = None
+        self._cells = {}
+        self._pending = {}
+
+    def pytest_sessionstart(self, session):
+        self._session = session
+
+    def pytest_collection_modifyitems(self, session, config, items):
+        for item in items:
+            func = getattr(item, "obj", None)
+            code = getattr(getattr(func, "__func__", func), "__code__", None)
+            if code is not None and code.co_filename != str(get_node_path(item)):
+                # parametrized tests share the cell of the function
+                self._cells[item.nodeid.partition("[")[0]] = code.co_filename
+
+    def pytest_runtest_logreport(self, report):
+        outcome, duration = self._pending.get(report.nodeid, ("passed", 0.0))
+
+        # a failed call is not overwritten by a teardown error
+        if outcome != "failed" and (report.when == "call" or not report.passed):
+            outcome = _get_event_outcome(report)
+
+        self._pending[report.nodeid] = outcome, duration + report.duration
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        outcome, duration = self._pending.pop(nodeid, ("passed", 0.0))
+        event = ResultEvent(
+            nodeid, outcome, duration, self._cells.get(nodeid.partition("[")[0])
+        )
+
+        if self.callback(event) is True and self._session is not None:
+            self._session.shouldstop = "stopped by the result event callback"
+
+
+def _get_event_outcome(report):
+    xfail = hasattr(report, "wasxfail")
+    if report.when != "call" and report.failed:
+        return "error"
+
+    if report.passed:
+        return "xpassed" if xfail else "passed"
+
+    if report.skipped:
+        return "xfailed" if xfail else "skipped"
+
+    return "failed"
+
+
 def ipytest_magic(line, cell, module=None):
     """IPython magic to first execute the cell, then execute [`ipytest.run()`][ipytest.run].
 
@@ -139,6 +408,10 @@ def ipytest_magic(line, cell, module=None):
     case, it deactivates default arguments and then instructs pytest to only
     execute `test1`.
 
+    With `# ipytest: background=True`, the tests are executed in the
+    background via [`ipytest.run_async()`][ipytest.run_async] and the magic
+    returns the future of the exit code.
+
     **NOTE:** In the default configuration `%%ipytest` will not raise
     exceptions, when tests fail. To raise exceptions on test errors, e.g.,
     inside a CI/CD context, use `ipytest.autoconfig(raise_on_error=True)`.
@@ -147,6 +420,7 @@ def ipytest_magic(line, cell, module=None):
 
     run_args = shlex.split(line)
     run_kwargs = eval_run_kwargs(cell, module=module)
+    background = run_kwargs.pop("background", False)
 
     clean(module=run_kwargs.get("module"))
 
@@ -163,7 +437,11 @@ def ipytest_magic(line, cell, module=None):
 
         raise e
 
+    if background:
+        return run_async(*run_args, **run_kwargs)
+
     run(*run_args, **run_kwargs)
+    return None
 
 
 # NOTE equivalent to @no_var_expand but does not require an IPython import
@@ -196,16 +474,64 @@ def clean(pattern=default, *, module=None):
     if pattern is False:
         return
 
+    # do not delete tests, while they are collected by a background run
+    wait_for_background_runs()
+
     if module is None:
         import __main__ as module
 
+    prefixes, match = _compile_clean_pattern(pattern)
+
     items = vars(module)
-    to_delete = [key for key in items if fnmatch.fnmatchcase(key, pattern)]
+    to_delete = [key for key in items if key.startswith(prefixes) and match(key)]
 
     for key in to_delete:
         del items[key]
 
 
+@functools.lru_cache(maxsize=32)
+def _compile_clean_pattern(pattern):
+    """Compile a glob pattern into a tuple of possible prefixes and a match function
+
+    The prefixes allow to skip most names with a cheap `str.startswith` check
+    before matching the full pattern.
+    """
+    return _get_glob_prefixes(pattern), re.compile(fnmatch.translate(pattern)).match
+
+
+def _get_glob_prefixes(pattern, max_prefixes=32):
+    prefixes = [""]
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if char in "*?":
+            break
+
+        if char == "[":
+            end = pattern.find("]", idx + 2)
+            if end < 0:
+                # an unclosed bracket matches itself
+                chars = "["
+
+            else:
+                chars = pattern[idx + 1 : end]
+                if chars[0] == "!" or "-" in chars or "\\" in chars:
+                    break
+
+                idx = end
+
+        else:
+            chars = char
+
+        if len(prefixes) * len(set(chars)) > max_prefixes:
+            break
+
+        prefixes = [prefix + char for prefix in prefixes for char in sorted(set(chars))]
+        idx += 1
+
+    return tuple(prefixes)
+
+
 def reload(*mods):
     """Reload all modules passed as strings.
 
@@ -254,15 +580,121 @@ def force_reload(*include: str, modules: Optional[Dict[str, ModuleType]] = None)
         modules.pop(name, None)
 
 
-def _run_impl(*args, module, plugins, addopts, defopts, display_columns, coverage):
-    with _prepared_env(module, display_columns=display_columns) as filename:
+def _run_impl(
+    *args,
+    module,
+    plugins,
+    last_run,
+    addopts,
+    defopts,
+    display_columns,
+    coverage,
+    session,
+    parallel,
+    profile,
+    result_cache,
+    only_affected,
+    reporter,
+    buffer_output,
+    shard,
+    reorder,
+):
+    import pytest
+
+    from ._plugins import (
+        AffectedSelectionPlugin,
+        ForkedRunPlugin,
+        NotebookReporterPlugin,
+        ProfilePlugin,
+        ReorderPlugin,
+        ResultCachePlugin,
+        ShardPlugin,
+        TimingPlugin,
+    )
+
+    timing = TimingPlugin(last_run["timings"])
+
+    run_plugins = [timing]
+    if parallel:
+        run_plugins.append(ForkedRunPlugin(parallel))
+
+    if profile:
+        last_run["profile"] = {}
+        run_plugins.append(ProfilePlugin(profile, last_run["profile"]))
+
+    if reporter == "notebook":
+        run_plugins.append(NotebookReporterPlugin())
+
+    with _prepared_env(
+        module, display_columns=display_columns, buffer_output=buffer_output
+    ) as filename:
+        timing.record("prepare_env")
+
+        if result_cache:
+            run_plugins.append(
+                ResultCachePlugin(
+                    filename,
+                    _result_cache_store,
+                    persist=result_cache == "persistent",
+                )
+            )
+
+        if only_affected:
+            run_plugins.append(AffectedSelectionPlugin(filename, _affected_snapshots))
+
+        if shard is not None:
+            run_plugins.append(ShardPlugin(filename, *shard))
+
+        if reorder:
+            run_plugins.append(ReorderPlugin(filename, _test_history))
+
         full_args = _build_full_args(
             args, filename, addopts=addopts, defopts=defopts, coverage=coverage
         )
+        timing.record("build_args")
+
         if coverage:
             warn_for_existing_coverage_configs()
 
-        return pytest.main(full_args, plugins=[*plugins, FixProgramNamePlugin()])
+        # NOTE: pytest-cov starts and stops coverage collection together with
+        # the config, therefore coverage runs always use a fresh config
+        persistent_session = None
+        if session == "persistent" and not coverage:
+            persistent_session = get_persistent_session(full_args, plugins, filename)
+
+        else:
+            # the persistent config keeps global state, e.g., the assertion
+            # rewriting import hook or the output capturing, installed
+            close_persistent_session()
+
+        if persistent_session is not None:
+            exit_code = persistent_session.run(run_plugins)
+
+        else:
+            exit_code = pytest.main(
+                full_args,
+                plugins=[*plugins, *create_builtin_plugins(filename), *run_plugins],
+            )
+
+    timing.record("teardown")
+    return exit_code
+
+
+def create_builtin_plugins(filename):
+    from ._plugins import FixProgramNamePlugin, NotebookCollectionPlugin
+
+    plugins = [FixProgramNamePlugin()]
+
+    if supports_in_memory_collection():
+        plugins.append(NotebookCollectionPlugin(filename))
+
+    return plugins
+
+
+def supports_in_memory_collection():
+    # NOTE: pytest<8 imports the module inside `DoctestModule.collect`, which
+    # requires a file
+    return get_pytest_version().release[0] >= 8
 
 
 def _build_full_args(args, filename, *, addopts, defopts, coverage):
@@ -308,8 +740,8 @@ class ArgMapping(dict):
 
 
 @contextlib.contextmanager
-def _prepared_env(module, *, display_columns):
-    with random_module_path() as path:
+def _prepared_env(module, *, display_columns, buffer_output):
+    with random_module_path(create_file=not supports_in_memory_collection()) as path:
         module_name = path.stem
 
         if not is_valid_module_name(module_name):
@@ -326,27 +758,252 @@ def _prepared_env(module, *, display_columns):
                 "report a bug at 'https://github.com/chmp/ipytest/issues'.",
             )
 
-        with patch(module, "__file__", str(path)), register_module(module, module_name):
-            with patched_columns(display_columns=display_columns):
-                yield str(path)
+        with patch(module, "__file__", str(path.absolute())):
+            with register_module(module, module_name):
+                with patched_columns(display_columns=display_columns):
+                    with buffered_output(buffer_output):
+                        yield str(path)
+
+
+_persistent_session = None
+
+# the keys of passed tests used by the result cache, shared between runs
+_result_cache_store = collections.OrderedDict()
+
+# the dependencies of passed tests used to select affected tests, shared between
+# runs
+_affected_snapshots = collections.OrderedDict()
+
+# the outcomes and durations of previous tests used to reorder tests
+_test_history = collections.OrderedDict()
+
+
+def get_persistent_session(args, plugins, filename):
+    """Get the persistent session for the args, create it if required
+
+    If the config cannot be created, e.g., due to invalid arguments, `None` is
+    returned and the run should fall back to `pytest.main` to report the error.
+    """
+    global _persistent_session
+
+    import pytest
+    from _pytest.config import ConftestImportFailure
+
+    if _persistent_session is not None and not _persistent_session.is_valid_for(
+        args, plugins, filename
+    ):
+        close_persistent_session()
+
+    if _persistent_session is None:
+        try:
+            _persistent_session = PersistentSession(args, plugins, filename)
+
+        except (pytest.UsageError, ConftestImportFailure):
+            return None
+
+    return _persistent_session
+
+
+def close_persistent_session():
+    global _persistent_session
+
+    if _persistent_session is not None:
+        _persistent_session.close()
+        _persistent_session = None
+
+
+class PersistentSession:
+    """A pytest config that is reused for multiple test sessions
+
+    `pytest.main` creates a new config for every call, i.e., it parses the
+    arguments, loads the ini files, registers plugins and imports `conftest.py`
+    files. This class performs these steps once and then executes repeated test
+    sessions with the same config.
+    """
+
+    def __init__(self, args, plugins, filename):
+        from _pytest.config import _prepareconfig
+
+        self.args = list(args)
+        self.plugins = list(plugins)
+        self.filename = filename
+        self.cwd = os.getcwd()
+
+        self.config = _prepareconfig(
+            self.args, plugins=[*self.plugins, *create_builtin_plugins(filename)]
+        )
+
+        # Cleanups registered during startup (e.g., global capturing or the
+        # assertion rewriting import hook) are executed by pytest after each
+        # session. Keep them separate and only execute them in `close`.
+        self._startup_cleanup = _detach_cleanups(self.config)
+
+        self._startup_plugins = {
+            id(plugin) for plugin in self.config.pluginmanager.get_plugins()
+        }
+        self._files_state = self._get_files_state()
+
+    def is_valid_for(self, args, plugins, filename):
+        return (
+            self.args == list(args)
+            and self.filename == filename
+            and len(self.plugins) == len(plugins)
+            and all(a is b for a, b in zip(self.plugins, plugins))
+            and self.cwd == os.getcwd()
+            and self._files_state == self._get_files_state()
+        )
+
+    def run(self, plugins=()):
+        import pytest
+
+        try:
+            for plugin in plugins:
+                self.config.pluginmanager.register(plugin)
+
+            exit_code = self.config.hook.pytest_cmdline_main(config=self.config)
+
+        except pytest.UsageError as e:
+            for msg in e.args:
+                print(f"ERROR: {msg}\n", file=sys.stderr)
+
+            return pytest.ExitCode.USAGE_ERROR
+
+        finally:
+            self.config._ensure_unconfigure()
+            self._unregister_session_plugins()
+
+        try:
+            return pytest.ExitCode(exit_code)
+
+        except ValueError:
+            return exit_code
+
+    def close(self):
+        try:
+            self.config._ensure_unconfigure()
+
+        finally:
+            self._startup_cleanup()
+
+    def _unregister_session_plugins(self):
+        # plugins registered during the session (e.g., the terminal reporter or
+        # the session itself) would clash with the plugins of the next session
+        pluginmanager = self.config.pluginmanager
+        for plugin in pluginmanager.get_plugins():
+            if id(plugin) not in self._startup_plugins:
+                pluginmanager.unregister(plugin)
+
+    def _get_files_state(self):
+        pluginmanager = self.config.pluginmanager
+
+        paths = {
+            pathlib.Path(mod.__file__)
+            for mod in getattr(pluginmanager, "_conftest_plugins", ())
+            if getattr(mod, "__file__", None) is not None
+        }
+        paths.update(
+            pathlib.Path(directory, "conftest.py")
+            for directory in getattr(pluginmanager, "_dirpath2confmods", {})
+        )
+        if (inipath := getattr(self.config, "inipath", None)) is not None:
+            paths.add(pathlib.Path(inipath))
+
+        return {path: _get_mtime(path) for path in paths}
+
+
+def _detach_cleanups(config):
+    """Remove the registered cleanups from the config, return a function to run them"""
+    # NOTE: pytest<8.1 stores the cleanups in a list
+    if not hasattr(config, "_cleanup_stack"):
+        cleanups = list(config._cleanup)
+        config._cleanup.clear()
+
+        def run_cleanups():
+            while cleanups:
+                cleanups.pop()()
+
+        return run_cleanups
+
+    return config._cleanup_stack.pop_all().close
+
+
+def _get_mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+
+    except OSError:
+        return None
 
 
 class RewriteAssertTransformer(ast.NodeTransformer):
+    """Rewrite the asserts of executed cells
+
+    Cells without `assert` statements are returned untouched. Rewritten ASTs
+    are cached by the source of the cell. The source is recorded by an input
+    transformer that runs after all other input transformers and is consumed by
+    the first AST transform that follows. The ASTs are stored in pickled form,
+    as unpickling is cheaper than both a `copy.deepcopy` and rewriting the
+    asserts again.
+    """
+
+    max_cache_size = 64
+
+    def __init__(self):
+        self._cache = collections.OrderedDict()
+        self._source = None
+
     def register_with_shell(self, shell):
+        shell.input_transformers_post.append(self.record_source)
         shell.ast_transformers.append(self)
 
     def unregister_with_shell(self, shell):
+        shell.input_transformers_post[:] = [
+            transformer
+            for transformer in shell.input_transformers_post
+            if getattr(transformer, "__self__", None) is not self
+        ]
         shell.ast_transformers[:] = [
             transformer
             for transformer in shell.ast_transformers
             if transformer is not self
         ]
 
+    def record_source(self, lines):
+        self._source = "".join(lines)
+        return lines
+
     def visit(self, node):
+        source, self._source = self._source, None
+        if not self._may_contain_asserts(source, node):
+            return node
+
+        key = self._get_cache_key(source)
+        signature = self._get_signature(node)
+
+        if key is not None and key in self._cache:
+            cached_signature, cached_node = self._cache[key]
+
+            # guard against ASTs that do not stem from the recorded source,
+            # e.g., if input transformers were added after this one
+            if cached_signature == signature:
+                self._cache.move_to_end(key)
+                return pickle.loads(cached_node)
+
+        node = self._rewrite_asserts(node)
+
+        if key is not None:
+            self._cache[key] = (signature, pickle.dumps(node, pickle.HIGHEST_PROTOCOL))
+            self._cache.move_to_end(key)
+
+            while len(self._cache) > self.max_cache_size:
+                self._cache.popitem(last=False)
+
+        return node
+
+    def _rewrite_asserts(self, node):
         from _pytest.assertion.rewrite import rewrite_asserts
 
-        pytest_version = get_pytest_version()
-        if pytest_version.release[0] >= 5:
+        if get_pytest_version().release[0] >= 5:
             # get the currently executing code from ipython?
             # TODO: re-create a pseudo code to include the asserts?
             rewrite_asserts(node, b"")
@@ -358,6 +1015,39 @@ class RewriteAssertTransformer(ast.NodeTransformer):
 
         return node
 
+    @staticmethod
+    def _may_contain_asserts(source, node):
+        # a substring check is much cheaper than walking the AST of cells with
+        # large literals. It may give false positives, e.g., for comments.
+        if source is not None:
+            return "assert" in source
+
+        return any(isinstance(child, ast.Assert) for child in ast.walk(node))
+
+    @staticmethod
+    def _get_cache_key(source):
+        if source is None:
+            return None
+
+        digest = hashlib.blake2b(source.encode("utf8"), digest_size=16).digest()
+        return (digest, str(get_pytest_version()))
+
+    @staticmethod
+    def _get_signature(node):
+        if not isinstance(node, ast.Module):
+            return None
+
+        return tuple(
+            (
+                type(item),
+                getattr(item, "lineno", None),
+                getattr(item, "col_offset", None),
+                getattr(item, "end_lineno", None),
+                getattr(item, "end_col_offset", None),
+            )
+            for item in node.body
+        )
+
     @staticmethod
     def _custom_fix_locations(node):
         if isinstance(node, ast.Module):
@@ -366,26 +1056,21 @@ class RewriteAssertTransformer(ast.NodeTransformer):
                     item.end_lineno = item.lineno
 
 
-class FixProgramNamePlugin:
-    def pytest_addoption(self, parser):
-        # Explanation:
-        #
-        # - the prog instance variable is defined, but never overwritten [1]
-        # - this variable is passed to the the underlying argparse Parser [2]
-        # - with a `None` value argparse uses sys.argv array to determine the
-        #   program name
-        #
-        # [1]: https://github.com/pytest-dev/pytest/blob/6d6bc97231f2d9a68002f1d191828fd3476ca8b8/src/_pytest/config/argparsing.py#L41
-        # [2]: https://github.com/pytest-dev/pytest/blob/6d6bc97231f2d9a68002f1d191828fd3476ca8b8/src/_pytest/config/argparsing.py#L397
-        # [3]: https://github.com/pytest-dev/pytest/blob/6d6bc97231f2d9a68002f1d191828fd3476ca8b8/src/_pytest/config/argparsing.py#L119
-        #
-        parser.prog = "%%ipytest"
-
-
+@functools.lru_cache(maxsize=None)
 def get_pytest_version():
+    import packaging.version
+    import pytest
+
     return packaging.version.parse(pytest.__version__)
 
 
+def get_node_path(node):
+    """Get the path of a pytest node as a `pathlib.Path`"""
+    # NOTE: `node.path` requires pytest>=7, older versions use `node.fspath`
+    path = getattr(node, "path", None)
+    return path if path is not None else pathlib.Path(str(node.fspath))
+
+
 @contextlib.contextmanager
 def patch(obj, attr, val):
     had_attr = hasattr(obj, attr)
@@ -405,10 +1090,17 @@ def patch(obj, attr, val):
 
 
 @contextlib.contextmanager
-def random_module_path():
+def random_module_path(*, create_file=False):
+    """Generate a path to represent the notebook module
+
+    The path is kept for the lifetime of the process. Only if `create_file` is
+    `True`, an empty file is created for the duration of the context.
+    """
     filename = getattr(random_module_path, "_filename", None)
 
     if filename is None:
+        import uuid
+
         for _ in range(RANDOM_MODULE_PATH_RETRIES):
             filename = f"t_{uuid.uuid4().hex}.py"
 
@@ -422,6 +1114,10 @@ def random_module_path():
             raise RuntimeError("Internal error: Could not generate a module filename")
 
     path = pathlib.Path(filename)
+    if not create_file:
+        yield path
+        return
+
     if path.exists():
         raise RuntimeError(f"Module filename {filename} does already exist")
     path.write_text("")
@@ -465,22 +1161,177 @@ def patched_columns(*, display_columns):
         del os.environ["COLUMNS"]
 
 
+@contextlib.contextmanager
+def buffered_output(enabled):
+    if not enabled:
+        yield
+        return
+
+    prev_stdout, prev_stderr = sys.stdout, sys.stderr
+    sys.stdout = stdout = BufferedOutput(prev_stdout)
+    sys.stderr = stderr = BufferedOutput(prev_stderr)
+
+    try:
+        yield
+
+    finally:
+        sys.stdout, sys.stderr = prev_stdout, prev_stderr
+        stdout.detach_buffer()
+        stderr.detach_buffer()
+
+
+class BufferedOutput:
+    """A text stream buffering the writes to another stream
+
+    The buffered text is forwarded, once `max_size` characters accumulated or
+    `max_delay` seconds passed since the last forward. Explicit flushes follow
+    the same rule. There is no timer, the delay is only checked when the
+    stream is written to or flushed. After `detach_buffer()` is called, all
+    writes are forwarded immediately, e.g., for references kept by pytest
+    after the run.
+    """
+
+    def __init__(self, stream, *, max_size=64 * 1024, max_delay=0.5):
+        self.stream = stream
+        self.max_size = max_size
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self._parts = []
+        self._size = 0
+        self._last_forward = time.monotonic()
+        self._detached = False
+
+    def write(self, text):
+        if self._detached:
+            return self.stream.write(text)
+
+        with self._lock:
+            self._parts.append(text)
+            self._size += len(text)
+
+            if self._size >= self.max_size:
+                self._forward()
+
+            else:
+                self._forward_if_due()
+
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self._detached:
+            self.stream.flush()
+            return
+
+        with self._lock:
+            self._forward_if_due()
+
+    def detach_buffer(self):
+        with self._lock:
+            self._forward()
+            self._detached = True
+
+    def _forward_if_due(self):
+        if time.monotonic() - self._last_forward >= self.max_delay:
+            self._forward()
+
+    def _forward(self):
+        if self._parts:
+            text = "".join(self._parts)
+            self._parts.clear()
+            self._size = 0
+            self.stream.write(text)
+
+        self.stream.flush()
+        self._last_forward = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
 def run_func_direct(func, *args, **kwargs):
     return func(*args, **kwargs)
 
 
 def run_func_in_thread(func, *args, **kwargs):
-    res = None
+    # NOTE: run nested calls directly, waiting for the executor would deadlock
+    if threading.current_thread() is _executor_thread:
+        return func(*args, **kwargs)
+
+    return submit_in_thread(func, *args, **kwargs).result()
+
+
+def submit_in_thread(func, *args, **kwargs):
+    # NOTE: the context is copied, to send the output to the cell that started
+    # the run (ipykernel tracks the current cell in a context variable)
+    context = contextvars.copy_context()
+    return get_executor().submit(
+        context.run, _run_with_executor_loop, func, *args, **kwargs
+    )
+
+
+_executor = None
+_executor_thread = None
+_executor_loop = None
+_executor_lock = threading.Lock()
+
+# the futures of the pending runs started by `run_async`
+_background_runs = set()
+
 
-    def _thread():
-        nonlocal res
-        res = func(*args, **kwargs)
+def wait_for_background_runs():
+    """Wait until all runs started by `run_async` finished"""
+    # NOTE: a nested call from a background run would wait for itself
+    if threading.current_thread() is _executor_thread:
+        return
+
+    from concurrent.futures import wait
+
+    wait(list(_background_runs))
+
+
+def get_executor():
+    """Get the executor used for `run_in_thread=True`, start it if required
 
-    t = threading.Thread(target=_thread)
-    t.start()
-    t.join()
+    The executor uses a single thread that is kept alive across runs. The thread
+    has its own asyncio event loop, that is reused by all runs.
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="ipytest",
+                initializer=_init_executor_thread,
+            )
 
-    return res
+    return _executor
+
+
+def _init_executor_thread():
+    global _executor_thread
+    _executor_thread = threading.current_thread()
+
+
+def _run_with_executor_loop(func, *args, **kwargs):
+    global _executor_loop
+
+    import asyncio
+
+    # NOTE: the loop is installed before each call, as plugins may reset the
+    # loop of the thread, e.g., pytest-asyncio after the first async test
+    if _executor_loop is None or _executor_loop.is_closed():
+        _executor_loop = asyncio.new_event_loop()
+
+    asyncio.set_event_loop(_executor_loop)
+    return func(*args, **kwargs)
 
 
 def is_valid_module_name(name):
@@ -0,0 +1,1351 @@
+"""Pytest plugins and collectors used by ipytest
+
+This module imports pytest. It is only imported, when tests are executed, to
+keep the import of `ipytest` itself cheap.
+"""
+
+import contextlib
+import cProfile
+import hashlib
+import heapq
+import html
+import inspect
+import multiprocessing
+import multiprocessing.connection
+import os
+import pathlib
+import pickle
+import pstats
+import signal
+import sys
+import time
+import warnings
+import weakref
+from types import CodeType, FunctionType, ModuleType
+
+import pytest
+from _pytest.doctest import DoctestModule
+from _pytest.reports import TestReport
+from _pytest.runner import runtestprotocol
+
+from ._impl import get_node_path, get_pytest_version
+
+
+class FixProgramNamePlugin:
+    def pytest_addoption(self, parser):
+        # Explanation:
+        #
+        # - the prog instance variable is defined, but never overwritten [1]
+        # - this variable is passed to the the underlying argparse Parser [2]
+        # - with a `None` value argparse uses sys.argv array to determine the
+        #   program name
+        #
+        # [1]: https://github.com/pytest-dev/pytest/blob/6d6bc97231f2d9a68002f1d191828fd3476ca8b8/src/_pytest/config/argparsing.py#L41
+        # [2]: https://github.com/pytest-dev/pytest/blob/6d6bc97231f2d9a68002f1d191828fd3476ca8b8/src/_pytest/config/argparsing.py#L397
+        # [3]: https://github.com/pytest-dev/pytest/blob/6d6bc97231f2d9a68002f1d191828fd3476ca8b8/src/_pytest/config/argparsing.py#L119
+        #
+        parser.prog = "%%ipytest"
+
+
+class NotebookCollectionPlugin:
+    """Collect the notebook without a file on disk
+
+    Pytest only accepts arguments that refer to existing files. Therefore,
+    arguments that refer to the notebook are removed from the arguments during
+    collection. The notebook is then collected separately and its items are
+    added to the collected items, before any other plugin modifies them. Node
+    ids of the form `{MODULE}::test_name` select the respective items.
+    """
+
+    def __init__(self, filename):
+        self.path = pathlib.Path(filename).absolute()
+        self._selections = None
+        self._notebook_first = False
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_collection(self, session):
+        config = session.config
+
+        orig_args = config.args
+        self._selections = [
+            arg for arg in orig_args if self._is_notebook_path(config, arg)
+        ]
+        # keep the order of the arguments, as pytest does for files
+        self._notebook_first = bool(orig_args) and orig_args[0] in self._selections
+        config.args = [arg for arg in orig_args if arg not in self._selections]
+
+        try:
+            yield
+
+        finally:
+            config.args = orig_args
+            self._selections = None
+
+    @pytest.hookimpl(hookwrapper=True, tryfirst=True)
+    def pytest_collection_modifyitems(self, session, config, items):
+        if self._selections:
+            notebook_items = self._collect_notebook(session)
+
+            if self._notebook_first:
+                items[:0] = notebook_items
+
+            else:
+                items.extend(notebook_items)
+
+        yield
+
+    def pytest_collect_file(self, file_path, parent):
+        if file_path != self.path:
+            return None
+
+        return NotebookModule.from_parent(parent, path=file_path)
+
+    def _collect_notebook(self, session):
+        ihook = session.gethookproxy(self.path)
+        items = [
+            item
+            for node in ihook.pytest_collect_file(file_path=self.path, parent=session)
+            for item in session.genitems(_adapt_notebook_node(node))
+        ]
+
+        selected = set()
+        for selection in self._selections:
+            names = selection.split("::")[1:]
+            matches = [item for item in items if _matches_names(item, names)]
+            if not matches:
+                raise pytest.UsageError(f"not found: {selection}")
+
+            selected.update(matches)
+
+        return [item for item in items if item in selected]
+
+    def _is_notebook_path(self, config, arg):
+        path, *_ = arg.split("::")
+        return (
+            pathlib.Path(os.path.normpath(config.invocation_params.dir / path))
+            == self.path
+        )
+
+
+def _adapt_notebook_node(node):
+    if isinstance(node, DoctestModule) and not isinstance(node, NotebookDoctestModule):
+        return NotebookDoctestModule.from_parent(node.parent, path=node.path)
+
+    return node
+
+
+def _matches_names(item, names):
+    chain = item.listchain()
+    (idx,) = (
+        idx
+        for idx, node in enumerate(chain)
+        if isinstance(node, (pytest.File, pytest.Module))
+    )
+    chain = chain[idx + 1 :]
+
+    return len(chain) >= len(names) and all(
+        name in (node.name, getattr(node, "originalname", None))
+        for node, name in zip(chain, names)
+    )
+
+
+class NotebookModule(pytest.Module):
+    """A module collector for notebooks
+
+    The notebook module is registered in `sys.modules` while pytest runs.
+    Therefore, it is used directly instead of going through the import system.
+
+    Notebooks often contain a large number of globals, e.g., data or the
+    IPython input and output history. For each of them pytest calls its
+    collection hooks and inspects them for fixtures. To avoid this overhead,
+    collection only sees the objects that may be tests, fixtures or setup
+    functions, i.e., callables, dunder attributes and marks. Outside of
+    collection, e.g., for `request.module` or `setup_module(module)`, the
+    notebook module itself is used.
+    """
+
+    def _getobj(self):
+        return sys.modules[self.path.stem]
+
+    def collect(self):
+        module = self.obj
+
+        namespace = ModuleType(module.__name__)
+        vars(namespace).update(
+            (name, obj)
+            for name, obj in list(vars(module).items())
+            if is_collection_candidate(name, obj)
+        )
+
+        self.obj = namespace
+        try:
+            return list(super().collect())
+
+        finally:
+            self.obj = module
+
+
+class NotebookDoctestModule(DoctestModule):
+    """A doctest collector that uses the notebook module without importing it"""
+
+    def _getobj(self):
+        return sys.modules[self.path.stem]
+
+
+def is_collection_candidate(name, obj):
+    return callable(obj) or name.startswith("__") or name == "pytestmark"
+
+
+class ForkedRunPlugin:
+    """Execute the collected tests in forked worker processes
+
+    The tests are collected in the kernel process. Afterwards, the kernel is
+    forked once per worker and each worker executes a contiguous shard of the
+    collected items. As the workers are forked, they share the notebook globals
+    and the collected items with the kernel without any serialization. The
+    reports are sent back to the kernel and replayed there. This way, the
+    kernel's plugins, e.g., the terminal reporter or the cache provider, see
+    the results as if the tests were executed in the kernel itself.
+    """
+
+    def __init__(self, num_workers):
+        self.num_workers = os.cpu_count() if num_workers is True else num_workers
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtestloop(self, session):
+        if (
+            session.testsfailed
+            and not session.config.option.continue_on_collection_errors
+        ):
+            raise session.Interrupted(
+                f"{session.testsfailed} error"
+                f"{'s' if session.testsfailed != 1 else ''} during collection"
+            )
+
+        if session.config.option.collectonly:
+            return True
+
+        num_workers = min(self.num_workers or 1, len(session.items))
+        if num_workers <= 1:
+            return None
+
+        # the workers exit without saving the coverage data they measured
+        if is_measuring_coverage():
+            warnings.warn(
+                "ipytest does not support parallel execution with coverage, "
+                "the tests are executed in the kernel",
+                pytest.PytestWarning,
+                stacklevel=1,
+            )
+            return None
+
+        shard_size = -(-len(session.items) // num_workers)
+        shards = [
+            session.items[start : start + shard_size]
+            for start in range(0, len(session.items), shard_size)
+        ]
+
+        workers = {}
+        try:
+            for shard in shards:
+                pid, conn = self._fork_worker(session, shard)
+                workers[conn] = pid
+
+            self._receive_reports(session, workers)
+
+        finally:
+            for conn, pid in workers.items():
+                with contextlib.suppress(OSError):
+                    os.kill(pid, signal.SIGKILL)
+                with contextlib.suppress(OSError):
+                    os.waitpid(pid, 0)
+
+                conn.close()
+
+        if session.shouldfail:
+            raise session.Failed(session.shouldfail)
+
+        if session.shouldstop:
+            raise session.Interrupted(session.shouldstop)
+
+        return True
+
+    def _fork_worker(self, session, shard):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+
+        with warnings.catch_warnings():
+            # the kernel is multi-threaded, the worker only uses the thread
+            # running the tests
+            warnings.simplefilter("ignore", DeprecationWarning)
+            pid = os.fork()
+
+        if pid != 0:
+            writer.close()
+            return pid, reader
+
+        exit_code = 1
+        try:
+            reader.close()
+            self._run_worker(session, shard, writer)
+            exit_code = 0
+
+        finally:
+            os._exit(exit_code)
+
+    def _run_worker(self, session, shard, conn):
+        # the streams of the kernel cannot be used in the forked process, any
+        # output not captured by pytest is discarded
+        with open(os.devnull, "w") as devnull:
+            sys.stdout = sys.stderr = devnull
+
+            pluginmanager = session.config.pluginmanager
+            pluginmanager.unregister(name="terminalreporter")
+
+            # restart capturing to not share the capture files with the kernel
+            capturemanager = pluginmanager.get_plugin("capturemanager")
+            if capturemanager is not None and capturemanager.is_globally_capturing():
+                capturemanager.stop_global_capturing()
+                capturemanager.start_global_capturing()
+                capturemanager.suspend_global_capture()
+
+            result_caches = [
+                plugin
+                for plugin in pluginmanager.get_plugins()
+                if isinstance(plugin, ResultCachePlugin)
+            ]
+            pluginmanager.register(ForkedWorkerPlugin(conn, result_caches))
+
+            try:
+                for idx, item in enumerate(shard):
+                    nextitem = shard[idx + 1] if idx + 1 < len(shard) else None
+                    item.config.hook.pytest_runtest_protocol(
+                        item=item, nextitem=nextitem
+                    )
+
+                    if session.shouldfail or session.shouldstop:
+                        break
+
+            finally:
+                session._setupstate.teardown_exact(None)
+
+    def _receive_reports(self, session, workers):
+        hook = session.config.hook
+        pending = list(workers)
+
+        while pending:
+            for conn in multiprocessing.connection.wait(pending):
+                try:
+                    nodeid, location, reports = conn.recv()
+
+                except EOFError:
+                    pending.remove(conn)
+                    _, status = os.waitpid(workers.pop(conn), 0)
+                    conn.close()
+
+                    if status != 0:
+                        raise session.Interrupted(
+                            f"ipytest worker exited unexpectedly (status {status})"
+                        )
+
+                    continue
+
+                hook.pytest_runtest_logstart(nodeid=nodeid, location=location)
+                for data in reports:
+                    report = hook.pytest_report_from_serializable(
+                        config=session.config, data=data
+                    )
+                    hook.pytest_runtest_logreport(report=report)
+
+                hook.pytest_runtest_logfinish(nodeid=nodeid, location=location)
+
+            if session.shouldfail or session.shouldstop:
+                break
+
+
+def is_measuring_coverage():
+    coverage = sys.modules.get("coverage")
+    return coverage is not None and coverage.Coverage.current() is not None
+
+
+class ForkedWorkerPlugin:
+    """Execute the tests of a forked worker and send their reports to the kernel
+
+    The tests are executed without calling the logging hooks, they are only
+    called in the kernel when the reports are replayed. This way, the hooks
+    of each plugin are called once per report. Cached tests are not executed,
+    their reports are sent instead.
+    """
+
+    def __init__(self, conn, result_caches):
+        self.conn = conn
+        self.result_caches = result_caches
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        reports = self._get_cached_reports(item)
+        if reports is not None:
+            teardown_exact(item, nextitem)
+
+        else:
+            reports = runtestprotocol(item, nextitem=nextitem, log=False)
+
+        config = item.config
+        data = [
+            config.hook.pytest_report_to_serializable(config=config, report=report)
+            for report in reports
+        ]
+
+        # send the reports of a test at once, to not interleave tests
+        self.conn.send((item.nodeid, item.location, data))
+        return True
+
+    def _get_cached_reports(self, item):
+        for result_cache in self.result_caches:
+            reports = result_cache.get_cached_reports(item)
+            if reports is not None:
+                return reports
+
+        return None
+
+
+def teardown_exact(item, nextitem):
+    """Tear down the fixtures of `item` not required by `nextitem`"""
+    if get_pytest_version().release[0] >= 7:
+        item.session._setupstate.teardown_exact(nextitem)
+
+    else:
+        item.session._setupstate.teardown_exact(item, nextitem)
+
+
+class TimingPlugin:
+    """Record the duration of the phases of a run
+
+    Each call to `record` attributes the time since the previous call to the
+    given phase. The phases inside pytest are recorded via hooks, the phases
+    outside of pytest are recorded by `ipytest.run()` itself.
+    """
+
+    def __init__(self, timings):
+        self.timings = timings
+        self._checkpoint = time.perf_counter()
+
+    def record(self, phase):
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + (now - self._checkpoint)
+        self._checkpoint = now
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_sessionstart(self, session):
+        self.record("configure")
+
+    @pytest.hookimpl(hookwrapper=True, tryfirst=True)
+    def pytest_collection(self, session):
+        yield
+        self.record("collection")
+
+    @pytest.hookimpl(hookwrapper=True, tryfirst=True)
+    def pytest_runtestloop(self, session):
+        self.record("collection")
+        yield
+        self.record("run")
+
+    @pytest.hookimpl(hookwrapper=True, tryfirst=True)
+    def pytest_sessionfinish(self, session, exitstatus):
+        self.record("run")
+        yield
+        self.record("sessionfinish")
+
+
+class ProfilePlugin:
+    """Profile each test call with `cProfile`
+
+    The raw profile data is attached to the report of the call phase. This
+    way, it is transferred together with the report from forked workers. The
+    kernel process collects the profiles of all reports and renders the
+    functions with the largest own time for the slowest tests.
+    """
+
+    def __init__(self, limit, profiles):
+        self.limit = 10 if limit is True else limit
+        self.profiles = profiles
+        self._profilers = {}
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        profiler = self._profilers[item.nodeid] = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+
+        finally:
+            profiler.disable()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        profiler = self._profilers.pop(item.nodeid, None)
+
+        if call.when == "call" and profiler is not None:
+            profiler.create_stats()
+            outcome.get_result().ipytest_profile = profiler.stats
+
+    def pytest_runtest_logreport(self, report):
+        stats = getattr(report, "ipytest_profile", None)
+        if stats:
+            self.profiles[report.nodeid] = pstats.Stats(_RawProfile(stats))
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.profiles:
+            return
+
+        terminalreporter.write_sep("=", "ipytest profile")
+
+        slowest = sorted(
+            self.profiles.items(), key=lambda item: item[1].total_tt, reverse=True
+        )
+        for nodeid, stats in slowest[: self.limit]:
+            terminalreporter.write_line("")
+            terminalreporter.write_line(f"{nodeid} ({stats.total_tt:.3f}s)")
+            terminalreporter.write_line(
+                f"{'ncalls':>10s} {'tottime':>10s} {'cumtime':>10s}  function"
+            )
+
+            top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+            for func, (_, ncalls, tottime, cumtime, _) in top[: self.limit]:
+                terminalreporter.write_line(
+                    f"{ncalls:10d} {tottime:10.6f} {cumtime:10.6f}  "
+                    f"{format_profile_function(func)}"
+                )
+
+
+class _RawProfile:
+    """Adapt raw profile data for the construction of `pstats.Stats` objects"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def format_profile_function(func):
+    filename, lineno, name = func
+    if filename == "~" and lineno == 0:
+        # built-in functions
+        return name
+
+    translated = translate_cell_filename(filename)
+    if translated == filename:
+        translated = os.path.basename(filename)
+
+    return f"{translated}:{lineno}({name})"
+
+
+def translate_cell_filename(filename):
+    # NOTE: use the tracker only if it is active, to not import coverage
+    tracker = getattr(sys.modules.get("ipytest.cov"), "_cell_filenames_tracker", None)
+    if tracker is None:
+        return filename
+
+    return tracker.translate_filename(filename)
+
+
+class ShardPlugin:
+    """Only execute the tests of a single shard
+
+    The collected tests are distributed over `count` shards by assigning the
+    longest tests first to the shard with the smallest total duration. The
+    durations are read from pytest's cache directory, tests without a recorded
+    duration are assumed to take the median duration. As long as all shards
+    see the same collected tests and the same cache, each test is executed by
+    exactly one shard.
+
+    The durations of the executed tests are recorded in the cache. Notebook
+    tests are identified by their name without the randomly generated module,
+    to keep the keys stable across kernels.
+    """
+
+    cache_key = "ipytest/durations"
+
+    def __init__(self, filename, index, count, *, max_size=10_000):
+        self.path = pathlib.Path(filename).absolute()
+        self.index = index
+        self.count = count
+        self.max_size = max_size
+        self._durations = {}
+        self._deselected = False
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, session, config, items):
+        cache = getattr(config, "cache", None)
+        durations = {} if cache is None else cache.get(self.cache_key, {})
+
+        known = sorted(durations.values())
+        fallback = known[len(known) // 2] if known else 1.0
+
+        # sort by decreasing duration, break ties by key to be deterministic
+        keyed_items = []
+        for item in items:
+            key = self._get_key(item)
+            keyed_items.append((-durations.get(key, fallback), key, item))
+
+        keyed_items.sort(key=lambda t: t[:2])
+
+        loads = [(0.0, shard) for shard in range(self.count)]
+        selected = set()
+        for neg_duration, _, item in keyed_items:
+            load, shard = heapq.heappop(loads)
+            heapq.heappush(loads, (load - neg_duration, shard))
+
+            if shard == self.index:
+                selected.add(id(item))
+
+        deselected = [item for item in items if id(item) not in selected]
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+            items[:] = [item for item in items if id(item) in selected]
+            self._deselected = True
+
+    def pytest_runtest_logreport(self, report):
+        key = self._get_key(report)
+        self._durations[key] = self._durations.get(key, 0.0) + report.duration
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        # an empty shard is not an error
+        if self._deselected and exitstatus == pytest.ExitCode.NO_TESTS_COLLECTED:
+            session.exitstatus = pytest.ExitCode.OK
+
+        cache = getattr(session.config, "cache", None)
+        if cache is None or not self._durations:
+            return
+
+        durations = cache.get(self.cache_key, {})
+        for key, duration in self._durations.items():
+            durations.pop(key, None)
+            durations[key] = duration
+
+        # keep the most recently recorded durations
+        cache.set(self.cache_key, dict(list(durations.items())[-self.max_size :]))
+
+    def _get_key(self, node):
+        return get_stable_nodeid(node.nodeid, self.path)
+
+
+def get_stable_nodeid(nodeid, path):
+    """Strip the randomly generated notebook module from the node id"""
+    module, sep, name = nodeid.partition("::")
+    if sep and pathlib.Path(module).name == path.name:
+        return name
+
+    return nodeid
+
+
+class ReorderPlugin:
+    """Execute previously failed tests first, then the others by increasing duration
+
+    The outcomes and durations of the tests are recorded in `history`, that is
+    shared between the runs in the kernel and keeps the `max_size` most
+    recently executed tests. Tests without recorded duration, e.g., newly
+    defined tests, are executed directly after the failed tests. Combined with
+    `-x`, failures are reported as early as possible.
+
+    The tests of a module or class are not interleaved with other tests.
+    Instead, the tests are sorted within their parent and the parents are
+    sorted by their tests.
+    """
+
+    def __init__(self, filename, history, *, max_size=10_000):
+        self.path = pathlib.Path(filename).absolute()
+        self.history = history
+        self.max_size = max_size
+        self._pending = {}
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, session, config, items):
+        # sort the parents, e.g., modules and classes, by their tests and the
+        # tests within each parent. This way, the tests of a parent are kept
+        # together and its scoped fixtures are only set up once
+        chains = [item.listchain()[1:] for item in items]
+        group_keys = {}
+        first_index = {}
+
+        for idx, (item, chain) in enumerate(zip(items, chains)):
+            key = self._get_sort_key(item)
+            for node in chain:
+                first_index.setdefault(node, idx)
+                group_keys[node] = combine_sort_keys(group_keys.get(node), key)
+
+        order = sorted(
+            range(len(items)),
+            key=lambda idx: [
+                (group_keys[node], first_index[node]) for node in chains[idx]
+            ],
+        )
+        items[:] = [items[idx] for idx in order]
+
+    def pytest_runtest_logreport(self, report):
+        failed, duration = self._pending.get(report.nodeid, (False, 0.0))
+        self._pending[report.nodeid] = (
+            failed or report.failed,
+            duration + report.duration,
+        )
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        if nodeid not in self._pending:
+            return
+
+        key = get_stable_nodeid(nodeid, self.path)
+        self.history.pop(key, None)
+        self.history[key] = self._pending.pop(nodeid)
+
+        while len(self.history) > self.max_size:
+            self.history.popitem(last=False)
+
+    def _get_sort_key(self, item):
+        key = get_stable_nodeid(item.nodeid, self.path)
+        if key not in self.history:
+            return (1, 0.0)
+
+        failed, duration = self.history[key]
+        return (0, 0.0) if failed else (2, duration)
+
+
+def combine_sort_keys(a, b):
+    """Combine the sort keys of two tests into the sort key of their parent
+
+    The parent is sorted by the first category of its tests and the total
+    duration of the tests in this category.
+    """
+    if a is None or a[0] > b[0]:
+        return b
+
+    if a[0] < b[0]:
+        return a
+
+    return (a[0], a[1] + b[1])
+
+
+class ResultCachePlugin:
+    """Skip tests that passed before and whose code and inputs did not change
+
+    For each test a key is computed from its code, the code and values of the
+    globals it depends on (transitively), its fixtures, its parameters and its
+    marks.
+    Tests whose key was recorded as passed are not executed, but reported as
+    passed. Tests with dependencies that cannot be hashed, e.g., unpicklable
+    globals, are always executed.
+
+    The keys are computed in the kernel process after collection, to also
+    support forked workers. The store of passed keys is an ordered dict, that
+    is shared between runs and evicts the least recently used keys. If
+    `persist` is `True`, it is also saved in pytest's cache directory. Running
+    pytest with `--cache-clear` clears the store.
+    """
+
+    cache_key = "ipytest/result-cache"
+
+    def __init__(self, filename, store, *, persist=False, max_size=10_000):
+        self.path = pathlib.Path(filename).absolute()
+        self.store = store
+        self.persist = persist
+        self.max_size = max_size
+        self._keys = {}
+        self._passed = PassedTests()
+
+    def pytest_configure(self, config):
+        cache = getattr(config, "cache", None)
+        if config.getoption("cacheclear", False):
+            self.store.clear()
+
+        elif self.persist and cache is not None:
+            for key in cache.get(self.cache_key, []):
+                self.store.setdefault(key, None)
+
+    def pytest_collection_finish(self, session):
+        hasher = DependencyHasher()
+        self._keys = {
+            item.nodeid: key
+            for item in session.items
+            if (key := self._get_key(item, hasher)) is not None
+        }
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        reports = self.get_cached_reports(item)
+        if reports is None:
+            return None
+
+        ihook = item.ihook
+        ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        for report in reports:
+            ihook.pytest_runtest_logreport(report=report)
+
+        ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+
+        # tear down the fixtures not required by the next item, as pytest does
+        # in the teardown phase
+        teardown_exact(item, nextitem)
+        return True
+
+    def get_cached_reports(self, item):
+        """Return the reports of a cached item or `None` if it must be executed"""
+        key = self._keys.get(item.nodeid)
+        if key is None or key not in self.store:
+            return None
+
+        self.store.move_to_end(key)
+        return [
+            TestReport(
+                nodeid=item.nodeid,
+                location=item.location,
+                keywords={name: 1 for name in item.keywords},
+                outcome="passed",
+                longrepr=None,
+                when=when,
+                ipytest_cached=True,
+            )
+            for when in ("setup", "call", "teardown")
+        ]
+
+    def pytest_report_teststatus(self, report, config):
+        if getattr(report, "ipytest_cached", False) and report.when == "call":
+            return "passed", "c", ("CACHED", {"green": True})
+
+        return None
+
+    def pytest_runtest_logreport(self, report):
+        self._passed.add_report(report)
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        key = self._keys.get(nodeid)
+        if key is None or nodeid not in self._passed:
+            return
+
+        self.store[key] = None
+        self.store.move_to_end(key)
+
+        while len(self.store) > self.max_size:
+            self.store.popitem(last=False)
+
+    def pytest_sessionfinish(self, session):
+        cache = getattr(session.config, "cache", None)
+        if self.persist and cache is not None:
+            cache.set(self.cache_key, list(self.store))
+
+    def _get_key(self, item, hasher):
+        func = getattr(item, "obj", None)
+        if not isinstance(func, FunctionType):
+            return None
+
+        h = hashlib.sha256()
+        h.update(get_stable_nodeid(item.nodeid, self.path).encode("utf8"))
+
+        try:
+            hasher.update(h, func)
+
+            name2fixturedefs = item._fixtureinfo.name2fixturedefs
+            for name in sorted(item.fixturenames):
+                if fixturedefs := name2fixturedefs.get(name):
+                    h.update(name.encode("utf8"))
+                    hasher.update(h, fixturedefs[-1].func)
+
+            callspec = getattr(item, "callspec", None)
+            if callspec is not None:
+                for name, value in sorted(callspec.params.items()):
+                    h.update(name.encode("utf8"))
+                    hasher.update(h, value)
+
+            # marks change the outcome, e.g., xfail(strict=True) or skipif
+            for mark in item.iter_markers():
+                h.update(mark.name.encode("utf8"))
+                for arg in mark.args:
+                    hasher.update(h, arg)
+
+                for name, value in sorted(mark.kwargs.items()):
+                    h.update(name.encode("utf8"))
+                    hasher.update(h, value)
+
+        except UnhashableDependency:
+            return None
+
+        return h.hexdigest()
+
+
+class NotebookReporterPlugin:
+    """Replace the per-test output of pytest by a single, throttled progress display
+
+    While the tests are executed, the output of the terminal reporter is
+    discarded and a single display is updated at most every `min_interval`
+    seconds. As each write to the output area is a separate message to the
+    frontend, this keeps large runs responsive. The header and the summary,
+    including the failures, are written by the terminal reporter as usual.
+
+    Outside of IPython, the final progress is written as a single line.
+    """
+
+    def __init__(self, min_interval=0.5):
+        self.min_interval = min_interval
+        self.progress = NotebookProgress()
+        self._config = None
+        self._handle = None
+        self._handle_pid = None
+        self._last_update = None
+
+    @pytest.hookimpl(hookwrapper=True, tryfirst=True)
+    def pytest_runtestloop(self, session):
+        reporter = session.config.pluginmanager.get_plugin("terminalreporter")
+        if reporter is None or session.config.option.collectonly:
+            yield
+            return
+
+        from IPython import get_ipython
+        from IPython.display import display
+
+        self._config = session.config
+        self.progress.total = len(session.items)
+
+        if get_ipython() is not None:
+            reporter.ensure_newline()
+            self._handle = display(self.progress, display_id=True)
+            self._handle_pid = os.getpid()
+
+        self._last_update = time.perf_counter()
+
+        with open(os.devnull, "w") as devnull:
+            terminal_writer = reporter._tw
+            reporter._tw = type(terminal_writer)(file=devnull)
+            reporter._tw.fullwidth = terminal_writer.fullwidth
+
+            try:
+                yield
+
+            finally:
+                reporter._tw = terminal_writer
+
+        if self._handle is not None:
+            self._handle.update(self.progress)
+
+        else:
+            reporter.write_line(repr(self.progress))
+
+    def pytest_runtest_logreport(self, report):
+        if self._config is None:
+            return
+
+        category, letter, word = self._config.hook.pytest_report_teststatus(
+            report=report, config=self._config
+        )
+        if letter or word:
+            self.progress.counts[category] = self.progress.counts.get(category, 0) + 1
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        self.progress.finished += 1
+
+        # forked processes must not write to the output of the kernel
+        now = time.perf_counter()
+        if (
+            self._handle is not None
+            and self._handle_pid == os.getpid()
+            and self._last_update is not None
+            and now - self._last_update >= self.min_interval
+        ):
+            self._last_update = now
+            self._handle.update(self.progress)
+
+
+class NotebookProgress:
+    """The progress of a run as shown by the notebook reporter"""
+
+    def __init__(self):
+        self.total = 0
+        self.finished = 0
+        self.counts = {}
+
+    def __repr__(self):
+        counts = ", ".join(
+            f"{count} {category}"
+            for category, count in self.counts.items()
+            if category and count
+        )
+        return f"{self.finished}/{self.total} tests finished" + (
+            f" ({counts})" if counts else ""
+        )
+
+    def _repr_html_(self):
+        return (
+            f'<progress value="{self.finished}" max="{max(self.total, 1)}">'
+            "</progress> "
+            f"<code>{html.escape(repr(self))}</code>"
+        )
+
+
+class AffectedSelectionPlugin:
+    """Only execute the notebook tests affected by changes since their last pass
+
+    For each notebook test the global names it depends on are determined from
+    the names referenced by its code, the code of the notebook functions and
+    classes it uses (transitively), closures, and notebook fixtures. When a
+    test passes, the values bound to these names are stored. In later runs,
+    the test is deselected, if all names are still bound to the same objects.
+    Tests that did not pass before are always executed.
+
+    Note, that in-place modifications, e.g., appending to a list, are not
+    detected, only rebinding a name.
+
+    The snapshots are stored in an ordered dict, that is shared between runs
+    and keeps the `max_size` most recently used snapshots. The values are
+    referenced weakly, if supported, to not keep rebound objects alive. The
+    snapshots of tests with rebound names are dropped during collection.
+    """
+
+    def __init__(self, filename, snapshots, *, max_size=10_000):
+        self.path = pathlib.Path(filename).absolute()
+        self.snapshots = snapshots
+        self.max_size = max_size
+        self._deselected = False
+        self._dependencies = {}
+        self._passed = PassedTests()
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, session, config, items):
+        selected = []
+        deselected = []
+
+        for item in items:
+            dependencies = (
+                get_global_dependencies(item)
+                if get_node_path(item) == self.path
+                else None
+            )
+            if dependencies is None:
+                selected.append(item)
+                continue
+
+            key = get_stable_nodeid(item.nodeid, self.path)
+            self._dependencies[item.nodeid] = (key, dependencies)
+
+            if _is_unchanged(self.snapshots.get(key), dependencies):
+                self.snapshots.move_to_end(key)
+                deselected.append(item)
+
+            else:
+                self.snapshots.pop(key, None)
+                selected.append(item)
+
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+            items[:] = selected
+            self._deselected = True
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        # not running any test, because no test is affected, is not an error
+        if self._deselected and exitstatus == pytest.ExitCode.NO_TESTS_COLLECTED:
+            session.exitstatus = pytest.ExitCode.OK
+
+    def pytest_runtest_logreport(self, report):
+        self._passed.add_report(report)
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        if nodeid not in self._dependencies:
+            return
+
+        key, dependencies = self._dependencies[nodeid]
+        if nodeid not in self._passed:
+            self.snapshots.pop(key, None)
+            return
+
+        self.snapshots[key] = {
+            name: _make_reference(value) for name, value in dependencies.items()
+        }
+        self.snapshots.move_to_end(key)
+
+        while len(self.snapshots) > self.max_size:
+            self.snapshots.popitem(last=False)
+
+
+class PassedTests:
+    """The node ids of the tests that passed, as reported by their reports
+
+    A test passed, if its call phase passed and no phase failed. Tests that
+    are expected to fail (xfail) never pass.
+    """
+
+    def __init__(self):
+        self._passed = set()
+        self._failed = set()
+
+    def __contains__(self, nodeid):
+        return nodeid in self._passed and nodeid not in self._failed
+
+    def add_report(self, report):
+        if report.failed:
+            self._failed.add(report.nodeid)
+
+        elif (
+            report.when == "call" and report.passed and not hasattr(report, "wasxfail")
+        ):
+            self._passed.add(report.nodeid)
+
+
+def _is_unchanged(snapshot, dependencies):
+    # a dead weak reference returns `None` and never matches a live object
+    return (
+        snapshot is not None
+        and snapshot.keys() == dependencies.keys()
+        and all(dependencies[name] is ref() for name, ref in snapshot.items())
+    )
+
+
+def _make_reference(obj):
+    try:
+        return weakref.ref(obj)
+
+    except TypeError:
+        # not all objects support weak references, e.g., ints or lists
+        return _StrongReference(obj)
+
+
+class _StrongReference:
+    __slots__ = ["obj"]
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __call__(self):
+        return self.obj
+
+
+def get_global_dependencies(item):
+    """Get the global names a test depends on and the objects bound to them
+
+    Returns `None` if the item is not a test function.
+    """
+    func = getattr(item, "obj", None)
+    func = getattr(func, "__func__", func)
+    if not isinstance(func, FunctionType):
+        return None
+
+    namespace = func.__globals__
+    missing = object()
+
+    def is_notebook_function(obj):
+        return isinstance(obj, FunctionType) and obj.__globals__ is namespace
+
+    def is_notebook_class(obj):
+        return isinstance(obj, type) and obj.__module__ == namespace.get("__name__")
+
+    def add_name(name):
+        value = namespace.get(name, missing)
+        if value is not missing:
+            dependencies[name] = value
+
+        return value
+
+    dependencies = {}
+    todo = [func]
+
+    add_name(getattr(item, "originalname", None) or func.__name__)
+
+    cls = getattr(item, "cls", None)
+    if cls is not None and is_notebook_class(cls):
+        add_name(cls.__name__)
+        todo.append(cls)
+
+    for fixturedefs in item._fixtureinfo.name2fixturedefs.values():
+        fixture_func = inspect.unwrap(fixturedefs[-1].func)
+        if is_notebook_function(fixture_func):
+            add_name(fixture_func.__name__)
+            todo.append(fixture_func)
+
+    seen = set()
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen:
+            continue
+
+        seen.add(id(obj))
+
+        if is_notebook_class(obj):
+            todo.extend(obj.__bases__)
+            todo.extend(
+                getattr(value, "__func__", value) for value in vars(obj).values()
+            )
+            continue
+
+        if not is_notebook_function(obj):
+            continue
+
+        obj = inspect.unwrap(obj)
+        for name in _get_global_names(obj.__code__):
+            value = add_name(name)
+            if value is not missing:
+                todo.append(value)
+
+        for cell in obj.__closure__ or ():
+            with contextlib.suppress(ValueError):
+                todo.append(cell.cell_contents)
+
+    return dependencies
+
+
+class UnhashableDependency(Exception):
+    pass
+
+
+class DependencyHasher:
+    """Hash objects together with the globals they depend on
+
+    Functions are hashed by their code, their defaults, closures and the
+    globals referenced by their code. Functions from installed modules are not
+    inspected, they are hashed by their name, as are modules. Modules in the
+    current directory are hashed by the content of their file. Classes defined
+    next to the functions referencing them are hashed by their attributes.
+    All other objects are hashed by their type and their pickled value.
+
+    The digest of each object is memoized by its id, the hasher should only be
+    used while the objects do not change.
+    """
+
+    def __init__(self):
+        self._digests = {}
+        self._keep_alive = []
+
+    def update(self, h, obj, namespace=None):
+        h.update(self.digest(obj, namespace))
+
+    def digest(self, obj, namespace=None):
+        key = (id(obj), id(namespace))
+        if key not in self._digests:
+            # mark as in progress to support recursive references
+            self._digests[key] = b"<recursive>"
+            self._keep_alive.append(obj)
+
+            h = hashlib.sha256()
+            self._update(h, obj, namespace)
+            self._digests[key] = h.digest()
+
+        return self._digests[key]
+
+    def _update(self, h, obj, namespace):
+        if isinstance(obj, FunctionType) and not _is_installed(obj.__module__):
+            self._update_function(h, obj)
+
+        elif isinstance(obj, property):
+            for func in (obj.fget, obj.fset, obj.fdel):
+                self.update(h, func, namespace)
+
+        elif isinstance(obj, (staticmethod, classmethod)):
+            self.update(h, obj.__func__, namespace)
+
+        elif (
+            isinstance(obj, type)
+            and namespace is not None
+            and obj.__module__ == namespace.get("__name__")
+        ):
+            h.update(f"class:{obj.__qualname__}".encode("utf8"))
+            for base in obj.__bases__:
+                self.update(h, base, namespace)
+
+            for name, value in vars(obj).items():
+                if name not in {"__dict__", "__weakref__", "__module__"}:
+                    h.update(name.encode("utf8"))
+                    self.update(h, value, namespace)
+
+        elif isinstance(obj, ModuleType):
+            h.update(f"module:{obj.__name__}".encode("utf8"))
+
+            # modules next to the notebook may be edited and reloaded
+            filename = getattr(obj, "__file__", None)
+            if filename is not None and not _is_installed_file(filename):
+                try:
+                    h.update(pathlib.Path(filename).read_bytes())
+
+                except OSError as exc:
+                    raise UnhashableDependency() from exc
+
+        elif callable(obj) and hasattr(obj, "__qualname__"):
+            name = f"{getattr(obj, '__module__', None)}.{obj.__qualname__}"
+            h.update(f"callable:{name}".encode("utf8"))
+
+        else:
+            self.update(h, type(obj), namespace)
+            try:
+                h.update(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+            except Exception as exc:
+                raise UnhashableDependency() from exc
+
+    def _update_function(self, h, func):
+        func = inspect.unwrap(func)
+        namespace = func.__globals__
+
+        self._update_code(h, func.__code__)
+
+        for value in func.__defaults__ or ():
+            self.update(h, value, namespace)
+
+        for name, value in sorted((func.__kwdefaults__ or {}).items()):
+            h.update(name.encode("utf8"))
+            self.update(h, value, namespace)
+
+        for cell in func.__closure__ or ():
+            try:
+                value = cell.cell_contents
+
+            except ValueError:
+                # empty cell
+                continue
+
+            self.update(h, value, namespace)
+
+        for name in sorted(_get_global_names(func.__code__)):
+            if name in namespace:
+                h.update(name.encode("utf8"))
+                self.update(h, namespace[name], namespace)
+
+    def _update_code(self, h, code):
+        # NOTE: filenames and line numbers are ignored, they change between
+        # kernels or when unrelated code in the cell is edited
+        h.update(code.co_code)
+        h.update(
+            repr(
+                (
+                    code.co_names,
+                    code.co_varnames,
+                    code.co_freevars,
+                    code.co_cellvars,
+                    code.co_argcount,
+                    code.co_kwonlyargcount,
+                    code.co_flags,
+                )
+            ).encode("utf8")
+        )
+        for const in code.co_consts:
+            if isinstance(const, CodeType):
+                self._update_code(h, const)
+
+            else:
+                h.update(repr(const).encode("utf8"))
+
+
+def _is_installed(module_name):
+    """Whether the module is backed by a file outside of the current directory"""
+    module = sys.modules.get(module_name or "")
+    filename = getattr(module, "__file__", None)
+    if module_name == "__main__" or filename is None:
+        return False
+
+    return _is_installed_file(filename)
+
+
+def _is_installed_file(filename):
+    return not os.path.abspath(filename).startswith(os.getcwd() + os.sep)
+
+
+def _get_global_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names.update(_get_global_names(const))
+
+    return names
@@ -26,30 +26,41 @@ further configuration is required.
 
 There are some known issues of `ipytest.cov`
 
-- Each notebook cell is reported as an individual file
+- Each notebook cell is reported as an individual file, unless
+  [`ipytest.cov.merge_cells()`](#ipytestcovmerge_cellsenabledtrue) is enabled
 - Lines that are executed at import time may not be encountered in tracing and
   may be reported as not-covered (One example is the line of a function
   definition)
-- Marking code to be excluded in branch coverage is currently not supported
-  (incl. coveragepy pragmas)
 
 [coverage-py-config-docs]: https://coverage.readthedocs.io/en/latest/config.html
 [ipytest-cov-pytest-cov]: https://pytest-cov.readthedocs.io/en/latest/config.html
 """
 
+import collections
+import hashlib
 import linecache
 import os
 import os.path
 import re
+import threading
 from typing import Optional
 
+import coverage.config
+import coverage.misc
 import coverage.parser
 import coverage.plugin
 import coverage.python
 
-__all__ = ["translate_cell_filenames"]
+__all__ = ["merge_cells", "translate_cell_filenames"]
 
 _cell_filenames_tracker = None
+_notebook_layout = None
+
+# parsed cell sources shared by all reporters in the kernel, keyed by a hash of
+# the source and the exclusion regexes, with the least recently used parsers
+# evicted first
+_parser_cache = collections.OrderedDict()
+_parser_cache_size = 1_024
 config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "coveragerc")
 
 
@@ -76,16 +87,67 @@ def translate_cell_filenames(enabled=True):
         _cell_filenames_tracker = None
 
 
+def merge_cells(enabled=True):
+    """Report all notebook cells as a single virtual file.
+
+    If enabled, the lines of all cells executed while measuring coverage are
+    mapped into a single file named `notebook.py`. Each cell is preceded by a
+    comment with its filename (or its cell name, if
+    [`ipytest.cov.translate_cell_filenames()`](#ipytestcov) is enabled). Cells
+    keep their position once measured. New cells are appended, cells known to
+    the cell filename tracker in execution order. This way the size of reports
+    and of the coverage data depends on the size of the notebook, not on the
+    number of executed cells.
+
+    The layout only exists in the current kernel, i.e., coverage data of
+    different kernels cannot be combined. Branch coverage is not supported, as
+    coverage.py records the exits of functions without the line mapping.
+
+    **Warning**: this is an experimental feature and not subject to any
+    stability guarantees.
+    """
+    global _notebook_layout
+
+    if enabled and _notebook_layout is None:
+        _notebook_layout = NotebookLayout()
+
+    elif not enabled:
+        _notebook_layout = None
+
+
 def coverage_init(reg, options):
-    reg.add_file_tracer(IPythonPlugin())
+    plugin = IPythonPlugin()
+    reg.add_file_tracer(plugin)
+    reg.add_configurer(plugin)
 
 
 class IPythonPlugin(coverage.plugin.CoveragePlugin):
     def __init__(self):
-        self._filename_pattern = self._build_filename_pattern()
+        self._filename_prefix = self._get_filename_prefix()
+        self._filename_pattern = self._build_filename_pattern(self._filename_prefix)
+
+        # NOTE: only decisions that cannot change are cached, files that are not
+        # yet in the linecache may be added by later cells
+        self._is_cell_file_cache = {}
+
+        self._exclude = coverage.misc.join_regex(coverage.config.DEFAULT_EXCLUDE)
+        self._no_branch = coverage.misc.join_regex(
+            coverage.config.DEFAULT_PARTIAL + coverage.config.DEFAULT_PARTIAL_ALWAYS
+        )
+
+    def configure(self, config):
+        # NOTE: the config is not modified, only the exclusion regexes are read
+        # once per coverage session
+        self._exclude = coverage.misc.join_regex(
+            config.get_option("report:exclude_lines")
+        )
+        self._no_branch = coverage.misc.join_regex(
+            config.get_option("report:partial_branches")
+            + config.get_option("report:partial_branches_always")
+        )
 
     @classmethod
-    def _build_filename_pattern(self):
+    def _get_filename_prefix(cls):
         try:
             import ipykernel.compiler
 
@@ -93,33 +155,62 @@ class IPythonPlugin(coverage.plugin.CoveragePlugin):
             return None
 
         else:
-            return re.compile(
-                r"^"
-                + re.escape(ipykernel.compiler.get_tmp_directory())
-                + re.escape(os.sep)
-                + r"\d+.py"
-            )
+            return ipykernel.compiler.get_tmp_directory() + os.sep
+
+    @classmethod
+    def _build_filename_pattern(cls, prefix):
+        if prefix is None:
+            return None
+
+        return re.compile(r"^" + re.escape(prefix) + r"\d+.py")
 
     def file_tracer(self, filename):
         if not self._is_ipython_cell_file(filename):
             return None
 
+        if _notebook_layout is not None:
+            return MergedCellFileTracer(filename, _notebook_layout)
+
         return IPythonFileTracer(filename)
 
     def file_reporter(self, filename):
-        return IPythonFileReporter(filename)
+        if _notebook_layout is not None and os.path.basename(filename) == (
+            NotebookLayout.filename
+        ):
+            return NotebookFileReporter(
+                filename,
+                _notebook_layout,
+                exclude=self._exclude,
+                no_branch=self._no_branch,
+            )
 
-    def _is_ipython_cell_file(self, filename: str):
-        if self._filename_pattern is None:
-            return False
+        return IPythonFileReporter(
+            filename, exclude=self._exclude, no_branch=self._no_branch
+        )
 
-        if os.path.exists(filename):
+    def _is_ipython_cell_file(self, filename: str):
+        try:
+            return self._is_cell_file_cache[filename]
+
+        except KeyError:
+            pass
+
+        # check the prefix first to avoid syscalls for most files
+        if (
+            self._filename_prefix is None
+            or not filename.startswith(self._filename_prefix)
+            or self._filename_pattern.match(filename) is None
+        ):
+            self._is_cell_file_cache[filename] = False
             return False
 
-        if self._filename_pattern.match(filename) is None:
+        if filename not in linecache.cache:
             return False
 
-        return filename in linecache.cache
+        # files written by ipykernel's debugger are executed as normal files
+        result = not os.path.exists(filename)
+        self._is_cell_file_cache[filename] = result
+        return result
 
 
 class IPythonFileTracer(coverage.plugin.FileTracer):
@@ -130,29 +221,55 @@ class IPythonFileTracer(coverage.plugin.FileTracer):
         return self._filename
 
 
+class MergedCellFileTracer(coverage.plugin.FileTracer):
+    def __init__(self, filename, layout):
+        self._filename = filename
+        self._layout = layout
+        self._offset = layout.get_offset(filename)
+
+    def source_filename(self):
+        return self._layout.get_filename()
+
+    def line_number_range(self, frame):
+        lineno = frame.f_lineno + self._offset
+        return lineno, lineno
+
+
 class IPythonFileReporter(coverage.python.PythonFileReporter):
     # TODO: implement fully from scratch to be independent from PythonFileReporter impl
 
+    def __init__(self, filename, *, exclude=None, no_branch=None):
+        super().__init__(filename)
+        self._exclude = exclude
+        self._no_branch = no_branch
+        self._parsed = None
+
     def __repr__(self) -> str:
         return f"<IPythonFileReporter {self.filename!r}>"
 
     @property
     def parser(self):
-        if self._parser is None:
-            self._parser = coverage.parser.PythonParser(text=self.source())
-            self._parser.parse_source()
-
-        return self._parser
+        return self._parse()[0]
 
     def source(self):
-        if self.filename not in linecache.cache:
-            raise RuntimeError(f"Could not lookup source for {self.filename!r}")
+        if self._source is None:
+            if self.filename not in linecache.cache:
+                raise RuntimeError(f"Could not lookup source for {self.filename!r}")
 
-        return "".join(linecache.cache[self.filename][2])
+            self._source = "".join(linecache.cache[self.filename][2])
+
+        return self._source
 
     def no_branch_lines(self):
-        # TODO: figure out how to implement this (require coverage config)
-        return set()
+        return self._parse()[1]
+
+    def _parse(self):
+        if self._parsed is None:
+            self._parsed = parse_cell(
+                self.source(), exclude=self._exclude, no_branch=self._no_branch
+            )
+
+        return self._parsed
 
     def relative_filename(self) -> str:
         if _cell_filenames_tracker is None:
@@ -161,12 +278,136 @@ class IPythonFileReporter(coverage.python.PythonFileReporter):
         return _cell_filenames_tracker.translate_filename(self.filename)
 
 
-class CellFilenamesTracker:
-    """An IPython plugin to map temporary filenames to cells"""
+class NotebookFileReporter(IPythonFileReporter):
+    def __init__(self, filename, layout, *, exclude=None, no_branch=None):
+        super().__init__(filename, exclude=exclude, no_branch=no_branch)
+        self._layout = layout
+
+    def __repr__(self) -> str:
+        return f"<NotebookFileReporter {self.filename!r}>"
+
+    def source(self):
+        if self._source is None:
+            self._source = self._layout.source()
+
+        return self._source
+
+    def relative_filename(self) -> str:
+        return NotebookLayout.filename
+
+
+class NotebookLayout:
+    """The positions of the cells in the single virtual notebook file
+
+    Each cell occupies a header line followed by its lines. Once added, the
+    position of a cell does not change.
+    """
+
+    filename = "notebook.py"
 
     def __init__(self):
-        self._info = {}
-        self._execution_count_counts = {}
+        self._lock = threading.Lock()
+        self._offsets = {}
+        self._cells = []
+        self._num_lines = 0
+
+    def get_filename(self):
+        prefix = IPythonPlugin._get_filename_prefix()
+        return os.path.join(prefix or os.getcwd(), self.filename)
+
+    def get_offset(self, filename):
+        with self._lock:
+            if filename not in self._offsets:
+                # add the cells that ran before in their execution order
+                if _cell_filenames_tracker is not None:
+                    for prev_filename in _cell_filenames_tracker.filenames():
+                        if (
+                            prev_filename not in self._offsets
+                            and prev_filename in linecache.cache
+                        ):
+                            self._add(prev_filename)
+
+                if filename not in self._offsets:
+                    self._add(filename)
+
+            return self._offsets[filename]
+
+    def _add(self, filename):
+        num_lines = len(linecache.cache[filename][2])
+
+        # the header occupies the line before the first line of the cell
+        self._offsets[filename] = self._num_lines + 1
+        self._cells.append((filename, num_lines))
+        self._num_lines += 1 + num_lines
+
+    def source(self):
+        with self._lock:
+            cells = list(self._cells)
+
+        parts = []
+        for filename, num_lines in cells:
+            name = (
+                _cell_filenames_tracker.translate_filename(filename)
+                if _cell_filenames_tracker is not None
+                else filename
+            )
+            parts.append(f"# {name}\n")
+
+            entry = linecache.cache.get(filename)
+            lines = list(entry[2]) if entry is not None else []
+            lines = [line if line.endswith("\n") else line + "\n" for line in lines]
+            lines = lines[:num_lines] + ["\n"] * (num_lines - len(lines))
+            parts.extend(lines)
+
+        return "".join(parts)
+
+
+def parse_cell(text, *, exclude=None, no_branch=None):
+    """Parse the source of a cell, reuse the results for identical sources
+
+    Returns the parser, with the statements and the lines excluded by the
+    `exclude` regex, and the lines matching the `no_branch` regex.
+    """
+    key = (
+        hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(),
+        exclude,
+        no_branch,
+    )
+
+    result = _parser_cache.get(key)
+    if result is not None:
+        _parser_cache.move_to_end(key)
+        return result
+
+    parser = coverage.parser.PythonParser(text=text, exclude=exclude)
+    parser.parse_source()
+
+    # NOTE: an empty regex (no configured patterns) would match all lines
+    no_branch_lines = parser.lines_matching(no_branch) if no_branch else set()
+
+    result = _parser_cache[key] = parser, no_branch_lines
+    while len(_parser_cache) > _parser_cache_size:
+        _parser_cache.popitem(last=False)
+
+    return result
+
+
+class CellFilenamesTracker:
+    """An IPython plugin to map temporary filenames to cells
+
+    To keep the overhead of executing cells low, the filenames are only computed
+    when they are requested. Only the `max_size` most recently executed cells
+    are kept.
+    """
+
+    def __init__(self, max_size=10_000):
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._info = collections.OrderedDict()
+        self._pending = collections.deque(maxlen=max_size)
+        self._last_execution_count = None
+        self._last_index = 0
         self._shell = None
 
     def register(self, shell):
@@ -178,6 +419,7 @@ class CellFilenamesTracker:
 
     def unregister(self):
         if self._shell is not None:
+            self._resolve_pending()
             self._shell.events.unregister("post_run_cell", self.on_post_run_cell)
             self._shell = None
 
@@ -185,35 +427,57 @@ class CellFilenamesTracker:
         if self._shell is None:
             return
 
-        try:
-            filename = self._shell.compile.get_code_name(
-                result.info.raw_cell,
-                None,
-                None,
-            )
-        except Exception as _exc:
-            # TODO: log exception
-            return
-
         # NOTE: inside magic cells, the cell may be executed without storing the
         # history, e.g., inside the `%%ipytest` cell magic. In that case the
         # `execution_count` is `None`. Use the shell's execution count. However,
         # now it may be found multiple times. Therefore use an increasing
-        # counter to avoid collisions
+        # counter to avoid collisions. As the execution count never decreases,
+        # only the last execution count has to be tracked.
         execution_count = (
             result.execution_count
             if result.execution_count is not None
             else self._shell.execution_count
         )
-        if execution_count in self._execution_count_counts:
-            self._execution_count_counts[execution_count] += 1
-            self._info[filename] = (
-                f"In[{execution_count}/{self._execution_count_counts[execution_count]}]"
-            )
+        if execution_count == self._last_execution_count:
+            self._last_index += 1
 
         else:
-            self._execution_count_counts[execution_count] = 0
-            self._info[filename] = f"In[{execution_count}]"
+            self._last_execution_count = execution_count
+            self._last_index = 0
+
+        self._pending.append((result.info.raw_cell, execution_count, self._last_index))
+
+    def filenames(self):
+        self._resolve_pending()
+        return list(self._info)
 
     def translate_filename(self, filename: str) -> Optional[int]:
-        return self._info.get(filename, filename)
+        self._resolve_pending()
+
+        info = self._info.get(filename)
+        if info is None:
+            return filename
+
+        execution_count, index = info
+        if index == 0:
+            return f"In[{execution_count}]"
+
+        return f"In[{execution_count}/{index}]"
+
+    def _resolve_pending(self):
+        with self._lock:
+            while self._pending and self._shell is not None:
+                raw_cell, execution_count, index = self._pending.popleft()
+
+                try:
+                    filename = self._shell.compile.get_code_name(raw_cell, None, None)
+
+                except Exception as _exc:
+                    # TODO: log exception
+                    continue
+
+                self._info.pop(filename, None)
+                self._info[filename] = (execution_count, index)
+
+                while len(self._info) > self.max_size:
+                    self._info.popitem(last=False)
@@ -87,6 +87,7 @@ class MockIPython:
     def __init__(self, *, module=None):
         self.module = module
         self.ast_transformers = []
+        self.input_transformers_post = []
         self.magic_functions = {}
 
     def register_magic_function(self, func, type, name):
@@ -0,0 +1,78 @@
+import sys
+import types
+
+import ipytest
+from ipytest._impl import BufferedOutput
+
+module_source = """
+import pytest
+
+@pytest.mark.parametrize("value", range(200))
+def test_example(value):
+    print("value", value)
+"""
+
+
+class CountingStream:
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, text):
+        self.writes.append(text)
+        return len(text)
+
+    def flush(self):
+        self.flushes += 1
+
+    def isatty(self):
+        return False
+
+
+def test_buffered_output():
+    stream = CountingStream()
+    output = BufferedOutput(stream, max_size=10, max_delay=60)
+
+    output.write("hello ")
+    output.flush()
+    assert stream.writes == []
+
+    output.write("world\n")
+    assert stream.writes == ["hello world\n"]
+
+    output.write("foo")
+    output.detach_buffer()
+    assert stream.writes == ["hello world\n", "foo"]
+
+    output.write("bar")
+    assert stream.writes == ["hello world\n", "foo", "bar"]
+
+
+def test_buffered_output_delay():
+    stream = CountingStream()
+    output = BufferedOutput(stream, max_size=1024, max_delay=0)
+
+    output.write("hello")
+    assert stream.writes == ["hello"]
+
+
+def run_counting_writes(monkeypatch, buffer_output):
+    module = types.ModuleType("dummy_module")
+    exec(module_source, module.__dict__, module.__dict__)
+
+    stream = CountingStream()
+    monkeypatch.setattr(sys, "stdout", stream)
+
+    exit_code = ipytest.run("-s", "-v", module=module, buffer_output=buffer_output)
+    monkeypatch.undo()
+
+    assert exit_code == 0
+    return stream
+
+
+def test_buffer_output_run(scoped_config, monkeypatch):
+    unbuffered = run_counting_writes(monkeypatch, False)
+    buffered = run_counting_writes(monkeypatch, True)
+
+    assert "".join(buffered.writes).count("value") == 200
+    assert len(buffered.writes) < len(unbuffered.writes) // 10
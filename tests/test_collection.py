@@ -0,0 +1,172 @@
+import types
+
+import pytest
+
+import ipytest
+from ipytest._impl import supports_in_memory_collection
+from ipytest._plugins import is_collection_candidate
+
+module_source = """
+import pytest
+
+data = list(range(1_000))
+test_data = [1, 2, 3]
+
+@pytest.fixture
+def value():
+    return 21
+
+def setup_module():
+    global module_value
+    module_value = 2
+
+def test_example(value):
+    assert module_value * value == 42
+
+class TestClass:
+    def test_method(self, value):
+        assert value == 21
+"""
+
+
+def test_collection(ipytest_entry_point):
+    exit_code = ipytest_entry_point("", "", module_source)
+    assert exit_code == 0
+
+
+def test_collection_pytestmark(ipytest_entry_point):
+    source = "import pytest\npytestmark = pytest.mark.xfail(strict=True)\n" + (
+        "def test_example():\n    assert False\n"
+    )
+    exit_code = ipytest_entry_point("", "", source)
+    assert exit_code == 0
+
+
+@pytest.mark.parametrize(
+    ("name", "obj", "expected"),
+    [
+        pytest.param("test_example", lambda: None, True),
+        pytest.param("TestClass", type("TestClass", (), {}), True),
+        pytest.param("fixture", pytest.fixture(lambda: None), True),
+        pytest.param("pytestmark", pytest.mark.skip, True),
+        pytest.param("__name__", "module", True),
+        pytest.param("test_data", [1, 2, 3], False),
+        pytest.param("_oh", {}, False),
+        pytest.param("pytest", pytest, False),
+    ],
+)
+def test_is_collection_candidate(name, obj, expected):
+    assert is_collection_candidate(name, obj) is expected
+
+
+selection_source = """
+import pytest
+
+def test_example():
+    pass
+
+@pytest.mark.parametrize("value", [1, 2])
+def test_param(value):
+    assert value == 1
+
+class TestClass:
+    def test_method(self):
+        pass
+
+    def test_other(self):
+        assert False
+"""
+
+
+@pytest.mark.parametrize(
+    "node_id",
+    [
+        "{test_example}",
+        "{MODULE}::test_param[1]",
+        "{MODULE}::TestClass::test_method",
+        "{MODULE}::test_example {MODULE}::TestClass::test_method",
+    ],
+)
+def test_collection_selection(ipytest_entry_point, node_id):
+    exit_code = ipytest_entry_point(node_id, "", selection_source)
+    assert exit_code == 0
+
+
+@pytest.mark.parametrize("node_id", ["{test_param}", "{MODULE}::TestClass"])
+def test_collection_selection_failures(ipytest_entry_point, node_id):
+    exit_code = ipytest_entry_point(node_id, "", selection_source)
+    assert exit_code == 1
+
+
+def test_collection_selection_not_found(ipytest_entry_point):
+    exit_code = ipytest_entry_point("{test_unknown}", "", selection_source)
+    assert exit_code == 4
+
+
+@pytest.mark.skipif(
+    not supports_in_memory_collection(), reason="requires in-memory collection"
+)
+def test_collection_does_not_create_files(ipytest_entry_point, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source = "import os\n\ndef test_example():\n    assert not os.listdir()\n"
+
+    exit_code = ipytest_entry_point("", "", source)
+    assert exit_code == 0
+
+
+module_access_source = """
+data = [1, 2]
+
+def setup_module(module):
+    module.value = 42
+
+def helper():
+    return 1
+
+def test_setup_module():
+    assert value == 42
+
+def test_request_module(request):
+    assert request.module.data == [1, 2]
+    assert getattr(request.module, "data", None) == [1, 2]
+
+def test_request_module_monkeypatch(request, monkeypatch):
+    monkeypatch.setattr(request.module, "helper", lambda: 2)
+    assert helper() == 2
+"""
+
+
+def test_collection_module_access(ipytest_entry_point):
+    exit_code = ipytest_entry_point("", "", module_access_source)
+    assert exit_code == 0
+
+
+@pytest.mark.parametrize("notebook_first", [True, False])
+def test_collection_argument_order(
+    scoped_config, tmp_path, monkeypatch, notebook_first
+):
+    monkeypatch.chdir(tmp_path)
+    # use distinct module names, as pytest keeps the imported test files
+    other = f"other_{notebook_first}_test.py"
+    (tmp_path / other).write_text("def test_other():\n    pass\n")
+
+    module = types.ModuleType("dummy_module")
+    exec("def test_notebook():\n    pass\n", module.__dict__, module.__dict__)
+
+    args = ["{MODULE}", other]
+    if not notebook_first:
+        args.reverse()
+
+    events = []
+    exit_code = ipytest.run(
+        "-qq",
+        *args,
+        module=module,
+        defopts=False,
+        plugins=[ipytest.ResultEvents(events.append)],
+    )
+    assert exit_code == 0
+
+    names = [event.nodeid.rpartition("::")[2] for event in events]
+    expected = ["test_notebook", "test_other"]
+    assert names == (expected if notebook_first else expected[::-1])
@@ -13,6 +13,8 @@ def test_autoconfig(scoped_config, mock_ipython):
 def test_config_rewrite_asserts(scoped_config, mock_ipython):
     ipytest.config(rewrite_asserts=True)
     assert len(mock_ipython.ast_transformers) == 1
+    assert len(mock_ipython.input_transformers_post) == 1
 
     ipytest.config(rewrite_asserts=False)
     assert len(mock_ipython.ast_transformers) == 0
+    assert len(mock_ipython.input_transformers_post) == 0
@@ -0,0 +1,34 @@
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+import ipytest
+
+# modules that should only be imported when tests are executed
+lazy_modules = ["IPython", "_pytest", "multiprocessing", "packaging", "pytest"]
+
+
+@pytest.fixture(scope="module")
+def imported_modules():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import ipytest"],
+        # ensure the ipytest package of the source tree is imported
+        cwd=pathlib.Path(ipytest.__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    return {
+        line.rpartition("|")[2].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+
+
+@pytest.mark.parametrize("module", lazy_modules)
+def test_import_is_lazy(imported_modules, module):
+    assert "ipytest._impl" in imported_modules
+    assert module not in imported_modules
@@ -1,9 +1,12 @@
 import ast
 import contextlib
+import fnmatch
 import io
 import os.path
+import pathlib
+import threading
 import types
-from types import ModuleType
+from types import ModuleType, SimpleNamespace
 
 import pytest
 
@@ -41,6 +44,31 @@ def test_clean(spec):
     assert set(vars(module)) & set(spec) == expected
 
 
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "[Tt]est*",
+        "test_*",
+        "*",
+        "?est",
+        "[!t]est*",
+        "[a-t]est*",
+        "t[]]e*",
+        "te[",
+        "[ab]",
+    ],
+)
+def test_clean_pattern_matches_fnmatch(pattern):
+    names = ["test", "Test", "test_a", "best", "]est", "t]est", "te[", "a", "b", "_x"]
+    expected = {name for name in names if fnmatch.fnmatchcase(name, pattern)}
+
+    module = types.ModuleType("module")
+    vars(module).update(dict.fromkeys(names))
+    ipytest.clean(pattern, module=module)
+
+    assert set(names) - set(vars(module)) == expected
+
+
 def test_reprs():
     assert repr(ipytest._config.keep) == "<keep>"
     assert repr(ipytest._config.default) == "<default>"
@@ -97,6 +125,80 @@ def test_rewrite_assert_transformer_runs():
     RewriteAssertTransformer().visit(node)
 
 
+rewrite_source = """
+def test_example():
+    x = 1
+    assert x == 2
+"""
+
+
+def rewrite_cell(transformer, source):
+    lines = transformer.record_source(source.splitlines(keepends=True))
+    return transformer.visit(ast.parse("".join(lines)))
+
+
+def test_rewrite_assert_transformer_caches_asts():
+    transformer = RewriteAssertTransformer()
+
+    first = rewrite_cell(transformer, rewrite_source)
+    second = rewrite_cell(transformer, rewrite_source)
+
+    assert len(transformer._cache) == 1
+    assert first is not second
+    assert ast.dump(first, include_attributes=True) == ast.dump(
+        second, include_attributes=True
+    )
+
+    namespace = {}
+    exec(compile(second, "<cell>", "exec"), namespace, namespace)
+    with pytest.raises(AssertionError, match="assert 1 == 2"):
+        namespace["test_example"]()
+
+
+def test_rewrite_assert_transformer_ignores_mismatched_asts():
+    transformer = RewriteAssertTransformer()
+    rewrite_cell(transformer, rewrite_source)
+
+    # an AST that does not stem from the recorded source is rewritten anew
+    transformer.record_source(rewrite_source.splitlines(keepends=True))
+    node = transformer.visit(ast.parse("assert False"))
+
+    assert any(isinstance(item, ast.If) for item in node.body)
+    assert not any(isinstance(item, ast.FunctionDef) for item in node.body)
+
+
+@pytest.mark.parametrize("record_source", [True, False])
+def test_rewrite_assert_transformer_skips_cells_without_asserts(record_source):
+    source = "data = [1, 2, 3]\nif data:\n    data.append(4)\n"
+    node = ast.parse(source)
+    expected = ast.dump(node, include_attributes=True)
+
+    transformer = RewriteAssertTransformer()
+    if record_source:
+        transformer.record_source(source.splitlines(keepends=True))
+
+    assert transformer.visit(node) is node
+    assert ast.dump(node, include_attributes=True) == expected
+    assert len(transformer._cache) == 0
+
+
+def test_rewrite_assert_transformer_finds_nested_asserts():
+    node = ast.parse("def test():\n    if True:\n        assert False\n")
+    node = RewriteAssertTransformer().visit(node)
+
+    assert not any(isinstance(child, ast.Assert) for child in ast.walk(node))
+
+
+def test_rewrite_assert_transformer_cache_is_bounded():
+    transformer = RewriteAssertTransformer()
+    transformer.max_cache_size = 2
+
+    for idx in range(5):
+        rewrite_cell(transformer, f"assert {idx} == {idx}")
+
+    assert len(transformer._cache) == 2
+
+
 def test_program_name():
     with io.StringIO() as fobj, contextlib.redirect_stderr(fobj):
         ipytest.run("--foo")
@@ -192,3 +294,94 @@ def test_arg_mapping__reserved_key():
 @pytest.mark.parametrize("name", ipytest.__all__)
 def test_all_objects_in_all_can_be_imported(name):
     assert hasattr(ipytest, name)
+
+
+def test_last_run_timings(ipytest_entry_point):
+    ipytest.last_run = None
+    exit_code = ipytest_entry_point("", "", "\ndef test():\n    pass\n")
+
+    assert ipytest.last_run["exit_code"] == exit_code == 0
+    assert list(ipytest.last_run["timings"]) == [
+        "prepare_env",
+        "build_args",
+        "configure",
+        "collection",
+        "run",
+        "sessionfinish",
+        "teardown",
+    ]
+    assert all(duration >= 0 for duration in ipytest.last_run["timings"].values())
+
+
+def test_run_in_thread_reuses_thread_and_loop():
+    module = ModuleType("dummy_module")
+    exec(
+        "import asyncio, threading\n"
+        "seen = []\n"
+        "def test():\n"
+        "    seen.append((threading.get_ident(), asyncio.get_event_loop()))\n",
+        module.__dict__,
+        module.__dict__,
+    )
+
+    for _ in range(2):
+        assert ipytest.run(module=module, run_in_thread=True) == 0
+
+    (first_thread, first_loop), (second_thread, second_loop) = module.seen
+    assert first_thread == second_thread != threading.get_ident()
+    assert first_loop is second_loop
+
+
+def test_run_in_thread_restores_loop_after_asyncio_run():
+    async_module = ModuleType("dummy_module")
+    exec(
+        "import pytest\n@pytest.mark.asyncio\nasync def test():\n    pass\n",
+        async_module.__dict__,
+        async_module.__dict__,
+    )
+
+    module = ModuleType("dummy_module")
+    exec(
+        "import asyncio\n"
+        "seen = []\n"
+        "def test():\n"
+        "    seen.append(asyncio.get_event_loop())\n",
+        module.__dict__,
+        module.__dict__,
+    )
+
+    # pytest-asyncio resets the loop of the thread after the async test
+    assert ipytest.run(module=async_module, run_in_thread=True) == 0
+    for _ in range(2):
+        assert ipytest.run(module=module, run_in_thread=True) == 0
+
+    first_loop, second_loop = module.seen
+    assert first_loop is second_loop
+    assert not first_loop.is_closed()
+
+
+def test_run_in_thread_propagates_exceptions():
+    with pytest.raises(ValueError, match="error in thread"):
+        ipytest._impl.run_func_in_thread(raise_value_error, "error in thread")
+
+
+def test_run_in_thread_nested_calls():
+    def nested():
+        return ipytest._impl.run_func_in_thread(threading.get_ident)
+
+    assert ipytest._impl.run_func_in_thread(nested) != threading.get_ident()
+
+
+def raise_value_error(msg):
+    raise ValueError(msg)
+
+
+def test_get_node_path():
+    path = pathlib.Path("dummy_module.py").absolute()
+
+    # pytest<7 only provides the py.path based fspath attribute
+    legacy_node = SimpleNamespace(fspath=str(path))
+    assert ipytest._impl.get_node_path(legacy_node) == path
+
+    node = SimpleNamespace(path=path, fspath=None)
+    assert ipytest._impl.get_node_path(node) is path
@@ -1,3 +1,8 @@
+import linecache
+import os
+import types
+import unittest.mock
+
 import pytest
 
 from ipytest._impl import find_coverage_configs
@@ -29,3 +34,179 @@ def test_find_coverage_configs(tmp_path, files, expected):
         tmp_path.joinpath(name).write_text(content)
 
     assert [p.name for p in find_coverage_configs(tmp_path)] == expected
+
+
+@pytest.fixture
+def ipython_plugin(tmp_path, monkeypatch):
+    cov = pytest.importorskip("ipytest.cov")
+
+    prefix = str(tmp_path) + os.sep
+    monkeypatch.setattr(
+        cov.IPythonPlugin, "_get_filename_prefix", classmethod(lambda cls: prefix)
+    )
+    return cov.IPythonPlugin()
+
+
+def test_ipython_plugin_skips_syscalls(ipython_plugin, monkeypatch):
+    def exists(path):
+        raise AssertionError("unexpected syscall")
+
+    monkeypatch.setattr(os.path, "exists", exists)
+    assert ipython_plugin.file_tracer(os.__file__) is None
+    assert ipython_plugin.file_tracer(os.__file__) is None
+
+
+def test_ipython_plugin_cell_files(ipython_plugin, tmp_path, monkeypatch):
+    filename = str(tmp_path / "1234.py")
+    assert ipython_plugin.file_tracer(filename) is None
+
+    # cells added to the linecache after the first lookup are detected
+    monkeypatch.setitem(linecache.cache, filename, (1, None, ["pass\n"], filename))
+    tracer = ipython_plugin.file_tracer(filename)
+    assert tracer is not None
+    assert tracer.source_filename() == filename
+
+    on_disk = tmp_path / "5678.py"
+    on_disk.write_text("pass\n")
+    monkeypatch.setitem(
+        linecache.cache, str(on_disk), (1, None, ["pass\n"], str(on_disk))
+    )
+    assert ipython_plugin.file_tracer(str(on_disk)) is None
+
+
+def test_ipython_file_reporter_parser_cache(tmp_path, monkeypatch):
+    cov = pytest.importorskip("ipytest.cov")
+    monkeypatch.setattr(cov, "_parser_cache", type(cov._parser_cache)())
+
+    def make_reporter(name, source):
+        filename = str(tmp_path / name)
+        lines = source.splitlines(keepends=True)
+        monkeypatch.setitem(linecache.cache, filename, (1, None, lines, filename))
+        return cov.IPythonFileReporter(filename)
+
+    first = make_reporter("1.py", "x = 1\nif x:\n    y = 2\n")
+    second = make_reporter("2.py", "x = 1\nif x:\n    y = 2\n")
+    changed = make_reporter("3.py", "x = 2\n")
+
+    assert first.lines() == {1, 2, 3}
+    assert second.parser is first.parser
+    assert changed.parser is not first.parser
+    assert changed.lines() == {1}
+    assert len(cov._parser_cache) == 2
+
+
+def test_merge_cells(ipython_plugin, tmp_path, monkeypatch):
+    coverage = pytest.importorskip("coverage")
+    cov = pytest.importorskip("ipytest.cov")
+
+    monkeypatch.setattr(cov, "_notebook_layout", None)
+    monkeypatch.setattr(cov, "_cell_filenames_tracker", None)
+    cov.merge_cells()
+
+    cells = {
+        str(tmp_path / "1.py"): "def add(a, b):\n    return a + b\n",
+        str(tmp_path / "2.py"): "def sub(a, b):\n    return a - b\n",
+        str(tmp_path / "3.py"): "assert add(1, 2) == 3\n",
+    }
+    for filename, source in cells.items():
+        lines = source.splitlines(keepends=True)
+        monkeypatch.setitem(linecache.cache, filename, (1, None, lines, filename))
+
+    monkeypatch.chdir(tmp_path)
+    tmp_path.joinpath(".coveragerc").write_text("[run]\nplugins =\n    ipytest.cov\n")
+
+    measurement = coverage.Coverage(data_file=None)
+    measurement.start()
+    try:
+        namespace = {}
+        for filename, source in cells.items():
+            exec(compile(source, filename, "exec"), namespace)
+
+    finally:
+        measurement.stop()
+
+    notebook_filename = str(tmp_path / "notebook.py")
+    assert list(measurement.get_data().measured_files()) == [notebook_filename]
+
+    _, statements, _, missing, _ = measurement.analysis2(notebook_filename)
+    assert statements == [2, 3, 5, 6, 8]
+    assert missing == [6]
+
+
+class FakeShell:
+    def __init__(self):
+        self.execution_count = 1
+        self.events = unittest.mock.Mock()
+        self.compile = unittest.mock.Mock()
+        self.compile.get_code_name.side_effect = lambda raw_cell, *_: (
+            f"/tmp/{raw_cell}.py"
+        )
+
+    def run_cell(self, tracker, raw_cell, *, store_history=True):
+        result = types.SimpleNamespace(
+            execution_count=self.execution_count if store_history else None,
+            info=types.SimpleNamespace(raw_cell=raw_cell),
+        )
+        tracker.on_post_run_cell(result)
+        if store_history:
+            self.execution_count += 1
+
+
+def test_cell_filenames_tracker():
+    cov = pytest.importorskip("ipytest.cov")
+
+    shell = FakeShell()
+    tracker = cov.CellFilenamesTracker(max_size=3)
+    tracker.register(shell)
+
+    shell.run_cell(tracker, "a")
+    shell.run_cell(tracker, "b", store_history=False)
+    shell.run_cell(tracker, "c", store_history=False)
+    shell.run_cell(tracker, "d")
+
+    # the filenames are only computed on demand
+    assert shell.compile.get_code_name.call_count == 0
+
+    assert tracker.translate_filename("/tmp/b.py") == "In[2]"
+    assert tracker.translate_filename("/tmp/c.py") == "In[2/1]"
+    assert tracker.translate_filename("/tmp/d.py") == "In[2/2]"
+    assert tracker.translate_filename("/tmp/unknown.py") == "/tmp/unknown.py"
+
+    # only the most recent cells are kept
+    assert tracker.translate_filename("/tmp/a.py") == "/tmp/a.py"
+    assert tracker.filenames() == ["/tmp/b.py", "/tmp/c.py", "/tmp/d.py"]
+
+
+def test_ipython_file_reporter_exclusions(ipython_plugin, tmp_path, monkeypatch):
+    cov = pytest.importorskip("ipytest.cov")
+    monkeypatch.setattr(cov, "_parser_cache", type(cov._parser_cache)())
+
+    source = (
+        "def f(x):\n"
+        "    if x:  # pragma: no branch\n"
+        "        return 1\n"
+        "    return 2  # pragma: no cover\n"
+        "\n"
+        "def g():  # custom-exclude\n"
+        "    return 3\n"
+    )
+    filename = str(tmp_path / "1.py")
+    lines = source.splitlines(keepends=True)
+    monkeypatch.setitem(linecache.cache, filename, (1, None, lines, filename))
+
+    reporter = ipython_plugin.file_reporter(filename)
+    assert reporter.lines() == {1, 2, 3, 6, 7}
+    assert reporter.excluded_lines() == {4}
+    assert reporter.no_branch_lines() == {2}
+
+    config = {
+        "report:exclude_lines": ["custom-exclude"],
+        "report:partial_branches": [],
+        "report:partial_branches_always": [],
+    }
+    ipython_plugin.configure(types.SimpleNamespace(get_option=config.__getitem__))
+
+    reporter = ipython_plugin.file_reporter(filename)
+    assert reporter.lines() == {1, 2, 3, 4}
+    assert reporter.excluded_lines() == {6, 7}
+    assert reporter.no_branch_lines() == set()
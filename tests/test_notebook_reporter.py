@@ -0,0 +1,81 @@
+import os
+import types
+
+import pytest
+
+import ipytest
+from ipytest._plugins import NotebookReporterPlugin
+
+module_source = """
+import pytest
+
+@pytest.mark.parametrize("value", range(50))
+def test_example(value):
+    assert value != 3
+"""
+
+
+def make_module():
+    module = types.ModuleType("dummy_module")
+    exec(module_source, module.__dict__, module.__dict__)
+    return module
+
+
+def test_notebook_reporter(scoped_config, capsys):
+    exit_code = ipytest.run("-q", module=make_module(), reporter="notebook")
+    assert exit_code == 1
+
+    output = capsys.readouterr().out
+    assert "50/50 tests finished (49 passed, 1 failed)" in output
+    assert "FAILURES" in output
+    assert "test_example[3]" in output
+    assert "....." not in output
+    assert "[100%]" not in output
+
+
+def test_notebook_reporter_display(scoped_config, mock_ipython, monkeypatch):
+    updates = []
+
+    class Handle:
+        def update(self, obj):
+            updates.append(repr(obj))
+
+    def display(obj, display_id=None):
+        updates.append(repr(obj))
+        return Handle()
+
+    monkeypatch.setattr("IPython.display.display", display)
+
+    ipytest.run("-qq", module=make_module(), reporter="notebook")
+
+    # the updates are throttled, only the initial and the final state are shown
+    assert updates == [
+        "0/50 tests finished",
+        "50/50 tests finished (49 passed, 1 failed)",
+    ]
+
+
+def test_notebook_reporter_unknown(scoped_config):
+    with pytest.raises(ValueError, match="Unknown reporter"):
+        ipytest.run(module=make_module(), reporter="unknown")
+
+
+def test_notebook_reporter_forked_process(monkeypatch):
+    updates = []
+
+    class Handle:
+        def update(self, obj):
+            updates.append(repr(obj))
+
+    plugin = NotebookReporterPlugin(min_interval=0)
+    plugin.progress.total = 2
+    plugin._handle = Handle()
+    plugin._handle_pid = os.getpid()
+    plugin._last_update = 0.0
+
+    plugin.pytest_runtest_logfinish("test_example", None)
+    assert updates == ["1/2 tests finished"]
+
+    monkeypatch.setattr(os, "getpid", lambda: plugin._handle_pid + 1)
+    plugin.pytest_runtest_logfinish("test_example", None)
+    assert updates == ["1/2 tests finished"]
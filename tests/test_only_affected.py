@@ -0,0 +1,186 @@
+import gc
+import types
+import weakref
+
+import pytest
+
+import ipytest
+import ipytest._impl
+from ipytest._plugins import AffectedSelectionPlugin
+
+module_source = """
+import pytest
+
+FACTOR = 2
+OTHER = 1
+
+def helper(x):
+    return FACTOR * x
+
+@pytest.fixture
+def value():
+    return 21
+
+def test_helper():
+    assert helper(1) == 2
+
+def test_fixture(value):
+    assert value == 21
+
+class TestClass:
+    def test_method(self):
+        assert OTHER == 1
+"""
+
+
+@pytest.fixture
+def affected_module(scoped_config):
+    ipytest._impl._affected_snapshots.clear()
+    module = types.ModuleType("dummy_module")
+    exec(module_source, module.__dict__, module.__dict__)
+
+    try:
+        yield module
+
+    finally:
+        ipytest._impl._affected_snapshots.clear()
+
+
+def run_affected(module, capsys):
+    exit_code = ipytest.run("-v", module=module, only_affected=True)
+    return exit_code, capsys.readouterr().out
+
+
+def test_only_affected_first_run(affected_module, capsys):
+    exit_code, output = run_affected(affected_module, capsys)
+    assert exit_code == 0
+    assert "3 passed" in output
+
+    exit_code, output = run_affected(affected_module, capsys)
+    assert exit_code == 0
+    assert "3 deselected" in output
+
+
+@pytest.mark.parametrize(
+    ("source", "expected"),
+    [
+        pytest.param("FACTOR = 2.0", "test_helper PASSED", id="transitive-global"),
+        pytest.param("def helper(x):\n    return 2 * x", "test_helper", id="helper"),
+        pytest.param(
+            "@pytest.fixture\ndef value():\n    return 21", "test_fixture", id="fixture"
+        ),
+        pytest.param("OTHER = 1.0", "TestClass::test_method", id="class"),
+    ],
+)
+def test_only_affected_rebound(affected_module, capsys, source, expected):
+    run_affected(affected_module, capsys)
+
+    exec(source, affected_module.__dict__, affected_module.__dict__)
+    exit_code, output = run_affected(affected_module, capsys)
+
+    assert exit_code == 0
+    assert expected in output
+    assert "1 passed, 2 deselected" in output
+
+
+def test_only_affected_reruns_failures(affected_module, capsys):
+    affected_module.FACTOR = 3
+    exit_code, output = run_affected(affected_module, capsys)
+    assert exit_code == 1
+    assert "1 failed, 2 passed" in output
+
+    exit_code, output = run_affected(affected_module, capsys)
+    assert exit_code == 1
+    assert "1 failed, 2 deselected" in output
+
+    affected_module.FACTOR = 2
+    exit_code, output = run_affected(affected_module, capsys)
+    assert exit_code == 0
+    assert "1 passed, 2 deselected" in output
+
+
+def test_only_affected_closure(scoped_config, capsys):
+    ipytest._impl._affected_snapshots.clear()
+    module = types.ModuleType("dummy_module")
+    exec(
+        "def make_check(expected):\n"
+        "    def check(value):\n"
+        "        return value == expected\n"
+        "    return check\n"
+        "\n"
+        "def make_test():\n"
+        "    check = make_check(1)\n"
+        "    def test_closure():\n"
+        "        assert check(1)\n"
+        "    return test_closure\n"
+        "\n"
+        "test_closure = make_test()\n",
+        module.__dict__,
+        module.__dict__,
+    )
+
+    try:
+        assert run_affected(module, capsys)[0] == 0
+
+        exec("def make_check(expected):\n    return None\n", module.__dict__)
+        _, output = run_affected(module, capsys)
+        assert "1 deselected" in output
+
+    finally:
+        ipytest._impl._affected_snapshots.clear()
+
+
+def test_only_affected_max_size(affected_module, capsys, monkeypatch):
+    monkeypatch.setattr(
+        AffectedSelectionPlugin.__init__, "__kwdefaults__", {"max_size": 2}
+    )
+
+    run_affected(affected_module, capsys)
+    assert list(ipytest._impl._affected_snapshots) == [
+        "test_fixture",
+        "TestClass::test_method",
+    ]
+
+    # the evicted snapshot is recorded again, evicting the least recently used
+    exit_code, output = run_affected(affected_module, capsys)
+    assert exit_code == 0
+    assert "1 passed, 2 deselected" in output
+    assert list(ipytest._impl._affected_snapshots) == [
+        "TestClass::test_method",
+        "test_helper",
+    ]
+
+
+def test_only_affected_does_not_keep_rebound_values(scoped_config, capsys):
+    ipytest._impl._affected_snapshots.clear()
+    module = types.ModuleType("dummy_module")
+    exec(
+        "class Data:\n"
+        "    pass\n"
+        "\n"
+        "data = Data()\n"
+        "\n"
+        "def test_data():\n"
+        "    assert isinstance(data, Data)\n"
+        "\n"
+        "def test_other():\n"
+        "    pass\n",
+        module.__dict__,
+        module.__dict__,
+    )
+
+    try:
+        assert run_affected(module, capsys)[0] == 0
+
+        ref = weakref.ref(module.data)
+        module.data = module.Data()
+        ipytest.run("-qq", "-k", "test_other", module=module, only_affected=True)
+
+        gc.collect()
+        assert ref() is None
+
+        _, output = run_affected(module, capsys)
+        assert "1 passed, 1 deselected" in output
+
+    finally:
+        ipytest._impl._affected_snapshots.clear()
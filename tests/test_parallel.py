@@ -0,0 +1,125 @@
+import os
+import types
+
+import pytest
+
+import ipytest
+import ipytest._impl
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork"), reason="parallel execution requires os.fork"
+)
+
+module_source = f"""
+import os
+import pytest
+
+KERNEL_PID = {os.getpid()}
+
+@pytest.mark.parametrize("value", range(4))
+def test_runs_in_worker(value):
+    assert os.getpid() != KERNEL_PID
+"""
+
+
+@pytest.mark.parametrize("session", ["fresh", "persistent"])
+def test_parallel(ipytest_entry_point, session):
+    try:
+        exit_code = ipytest_entry_point(
+            "", f"parallel=2, session={session!r}", module_source
+        )
+        assert exit_code == 0
+
+    finally:
+        ipytest._impl.close_persistent_session()
+
+
+def test_parallel_failures(ipytest_entry_point):
+    source = "def test_pass():\n    pass\n\ndef test_fail():\n    assert False\n"
+    exit_code = ipytest_entry_point("", "parallel=2", source)
+    assert exit_code == 1
+
+
+def test_parallel_single_item_runs_in_kernel(ipytest_entry_point):
+    source = (
+        f"import os\n\ndef test_kernel():\n    assert os.getpid() == {os.getpid()}\n"
+    )
+    exit_code = ipytest_entry_point("", "parallel=2", source)
+    assert exit_code == 0
+
+
+class RecordLogHooks:
+    def __init__(self, path):
+        self.path = path
+
+    def record(self, name, nodeid):
+        with open(self.path, "a") as fobj:
+            print(os.getpid(), name, nodeid.partition("::")[2], file=fobj)
+
+    def pytest_runtest_logstart(self, nodeid):
+        self.record("logstart", nodeid)
+
+    def pytest_runtest_logreport(self, report):
+        self.record(f"logreport-{report.when}", report.nodeid)
+
+    def pytest_runtest_logfinish(self, nodeid):
+        self.record("logfinish", nodeid)
+
+
+def test_parallel_calls_log_hooks_once_in_kernel(scoped_config, tmp_path):
+    path = tmp_path / "hooks.txt"
+    module = types.ModuleType("dummy_module")
+    exec(module_source, module.__dict__, module.__dict__)
+
+    exit_code = ipytest.run(
+        "-qq", module=module, plugins=[RecordLogHooks(path)], parallel=2
+    )
+    assert exit_code == 0
+
+    calls = [line.split() for line in path.read_text().splitlines()]
+    assert {pid for pid, _, _ in calls} == {str(os.getpid())}
+    assert sorted((name, test) for _, name, test in calls) == sorted(
+        (name, f"test_runs_in_worker[{value}]")
+        for value in range(4)
+        for name in [
+            "logstart",
+            "logreport-setup",
+            "logreport-call",
+            "logreport-teardown",
+            "logfinish",
+        ]
+    )
+
+
+def test_parallel_result_cache(scoped_config, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    module = types.ModuleType("dummy_module")
+    exec(module_source, module.__dict__, module.__dict__)
+
+    ipytest._impl._result_cache_store.clear()
+    try:
+        for _ in range(2):
+            exit_code = ipytest.run("-v", module=module, result_cache=True, parallel=2)
+            assert exit_code == 0
+
+        assert capsys.readouterr().out.count("CACHED") == 4
+
+    finally:
+        ipytest._impl._result_cache_store.clear()
+
+
+def test_parallel_coverage_runs_in_kernel(scoped_config, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    module = types.ModuleType("dummy_module")
+    exec(
+        f"import os\n\ndef test_a():\n    assert os.getpid() == {os.getpid()}\n\n"
+        f"def test_b():\n    assert os.getpid() == {os.getpid()}\n",
+        module.__dict__,
+        module.__dict__,
+    )
+
+    with pytest.warns(pytest.PytestWarning, match="parallel execution with coverage"):
+        exit_code = ipytest.run("-q", module=module, coverage=True, parallel=2)
+
+    assert exit_code == 0
+    assert "No data was collected" not in capsys.readouterr().out
@@ -0,0 +1,116 @@
+import os
+import sys
+import types
+
+import pytest
+
+import ipytest
+import ipytest._impl
+
+module_source = """
+def test1():
+    assert True
+
+def test2():
+    assert False
+"""
+
+
+@pytest.fixture
+def persistent_session(scoped_config):
+    ipytest.config(session="persistent")
+    try:
+        yield
+
+    finally:
+        ipytest._impl.close_persistent_session()
+
+
+def make_module(source):
+    module = types.ModuleType("dummy_module")
+    exec(source, module.__dict__, module.__dict__)
+    return module
+
+
+def test_persistent_session_is_reused(persistent_session):
+    module = make_module(module_source)
+
+    assert ipytest.run("{test1}", module=module) == 0
+    session = ipytest._impl._persistent_session
+    assert session is not None
+
+    assert ipytest.run("{test1}", module=module) == 0
+    assert ipytest._impl._persistent_session is session
+
+
+def test_persistent_session_collects_new_tests(persistent_session):
+    module = make_module(module_source)
+    assert ipytest.run("-k", "test1", module=module) == 0
+
+    exec("def test1():\n    assert False", module.__dict__, module.__dict__)
+    assert ipytest.run("-k", "test1", module=module) == 1
+
+
+def test_persistent_session_invalidated_by_args(persistent_session):
+    module = make_module(module_source)
+
+    assert ipytest.run("{test1}", module=module) == 0
+    session = ipytest._impl._persistent_session
+
+    assert ipytest.run("{test2}", module=module) == 1
+    assert ipytest._impl._persistent_session is not session
+
+
+def test_persistent_session_closed_by_config(persistent_session):
+    assert ipytest.run("{test1}", module=make_module(module_source)) == 0
+    assert ipytest._impl._persistent_session is not None
+
+    ipytest.config(session="fresh")
+    assert ipytest._impl._persistent_session is None
+
+
+def test_persistent_session_closed_by_fresh_run(scoped_config):
+    module = make_module(module_source)
+    try:
+        assert ipytest.run("{test1}", module=module, session="persistent") == 0
+        assert ipytest._impl._persistent_session is not None
+
+        meta_path = list(sys.meta_path)
+        assert ipytest.run("{test1}", module=module) == 0
+        assert ipytest._impl._persistent_session is None
+        assert len(sys.meta_path) < len(meta_path)
+
+    finally:
+        ipytest._impl.close_persistent_session()
+
+
+def test_persistent_session_entry_points(ipytest_entry_point):
+    try:
+        exit_code = ipytest_entry_point("", "session='persistent'", module_source)
+        assert exit_code == 1
+
+    finally:
+        ipytest._impl.close_persistent_session()
+
+
+def test_unknown_session_mode():
+    with pytest.raises(ValueError, match="Unknown session mode"):
+        ipytest.run(session="unknown")
+
+
+def test_persistent_session_invalidated_by_conftest(
+    persistent_session, tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    conftest_path = tmp_path / "conftest.py"
+    conftest_path.write_text("")
+
+    module = make_module(module_source)
+    assert ipytest.run("{test1}", module=module) == 0
+    session = ipytest._impl._persistent_session
+
+    conftest_path.write_text("# changed\n")
+    os.utime(conftest_path, ns=(0, 0))
+
+    assert ipytest.run("{test1}", module=module) == 0
+    assert ipytest._impl._persistent_session is not session
@@ -0,0 +1,47 @@
+import os
+import pstats
+
+import ipytest
+from ipytest._plugins import format_profile_function
+
+module_source = """
+def helper():
+    return sum(range(1_000))
+
+def test1():
+    assert helper()
+
+def test2():
+    assert helper()
+"""
+
+
+def test_profile(ipytest_entry_point, capsys):
+    exit_code = ipytest_entry_point("", "profile=1", module_source)
+    assert exit_code == 0
+
+    profiles = ipytest.last_run["profile"]
+    assert sorted(nodeid.partition("::")[2] for nodeid in profiles) == [
+        "test1",
+        "test2",
+    ]
+    assert all(isinstance(stats, pstats.Stats) for stats in profiles.values())
+
+    # only the slowest test is reported
+    output = capsys.readouterr().out
+    assert "ipytest profile" in output
+    assert sum(f"::{name} (" in output for name in ["test1", "test2"]) == 1
+
+
+def test_profile_disabled(ipytest_entry_point):
+    assert ipytest_entry_point("", "", module_source) == 0
+    assert "profile" not in ipytest.last_run
+
+
+def test_format_profile_function():
+    assert format_profile_function(("~", 0, "<built-in method len>")) == (
+        "<built-in method len>"
+    )
+    assert format_profile_function((os.path.join("foo", "bar.py"), 3, "baz")) == (
+        "bar.py:3(baz)"
+    )
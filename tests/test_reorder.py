@@ -0,0 +1,110 @@
+import types
+
+import pytest
+
+import ipytest
+import ipytest._impl
+
+module_source = """
+import time
+
+def test_slow():
+    time.sleep(0.05)
+
+def test_fast():
+    pass
+
+def test_fail():
+    assert FAIL is False
+"""
+
+
+@pytest.fixture
+def reorder_module(scoped_config):
+    ipytest._impl._test_history.clear()
+    module = types.ModuleType("dummy_module")
+    exec(module_source, module.__dict__, module.__dict__)
+    module.FAIL = False
+
+    try:
+        yield module
+
+    finally:
+        ipytest._impl._test_history.clear()
+
+
+def run_order(module, *args):
+    events = []
+    ipytest.run(
+        "-qq",
+        *args,
+        module=module,
+        plugins=[ipytest.ResultEvents(events.append)],
+        reorder=True,
+    )
+    return [event.nodeid.partition("::")[2] for event in events]
+
+
+def test_reorder(reorder_module):
+    assert run_order(reorder_module) == ["test_slow", "test_fast", "test_fail"]
+
+    order = run_order(reorder_module)
+    assert order[-1] == "test_slow"
+
+    reorder_module.FAIL = True
+    run_order(reorder_module)
+
+    reorder_module.FAIL = False
+    assert run_order(reorder_module)[0] == "test_fail"
+
+
+def test_reorder_fail_fast(reorder_module):
+    run_order(reorder_module)
+
+    reorder_module.FAIL = True
+    assert run_order(reorder_module, "-x")[-1] == "test_fail"
+    assert run_order(reorder_module, "-x") == ["test_fail"]
+
+
+def test_reorder_new_tests_first(reorder_module):
+    run_order(reorder_module)
+
+    exec("def test_new():\n    pass\n", reorder_module.__dict__)
+    assert run_order(reorder_module)[0] == "test_new"
+
+
+grouped_source = """
+import time
+import pytest
+
+SETUPS = []
+
+@pytest.fixture(scope="class")
+def resource():
+    SETUPS.append(None)
+
+class TestGroup:
+    def test_fast(self, resource):
+        pass
+
+    def test_slow(self, resource):
+        time.sleep(0.1)
+
+def test_medium():
+    time.sleep(0.05)
+"""
+
+
+def test_reorder_keeps_classes_together(reorder_module):
+    module = types.ModuleType("dummy_module")
+    exec(grouped_source, module.__dict__, module.__dict__)
+
+    run_order(module)
+    module.SETUPS.clear()
+
+    assert run_order(module) == [
+        "test_medium",
+        "TestGroup::test_fast",
+        "TestGroup::test_slow",
+    ]
+    assert len(module.SETUPS) == 1
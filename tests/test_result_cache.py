@@ -0,0 +1,157 @@
+import hashlib
+import threading
+import types
+
+import pytest
+
+import ipytest
+import ipytest._impl
+from ipytest._plugins import DependencyHasher, UnhashableDependency
+
+module_source = """
+FACTOR = 2
+
+def helper(x):
+    return FACTOR * x
+
+def test_helper():
+    assert helper(1) == 2
+
+def test_fail():
+    assert False
+"""
+
+
+@pytest.fixture
+def result_cache(scoped_config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ipytest._impl._result_cache_store.clear()
+    try:
+        yield
+
+    finally:
+        ipytest._impl._result_cache_store.clear()
+
+
+def test_result_cache(ipytest_entry_point, result_cache, capsys):
+    assert ipytest_entry_point("-v", "result_cache=True", module_source) == 1
+    output = capsys.readouterr().out
+    assert "test_helper PASSED" in output
+
+    assert ipytest_entry_point("-v", "result_cache=True", module_source) == 1
+    output = capsys.readouterr().out
+    assert "test_helper CACHED" in output
+    assert "test_fail FAILED" in output
+
+    changed_source = module_source.replace("FACTOR = 2", "FACTOR = 3")
+    assert ipytest_entry_point("-v", "result_cache=True", changed_source) == 1
+    output = capsys.readouterr().out
+    assert "test_helper FAILED" in output
+
+
+@pytest.mark.parametrize(
+    ("mark", "expected_exit_code"),
+    [
+        pytest.param("@pytest.mark.xfail(strict=True)", 1, id="xfail"),
+        pytest.param("@pytest.mark.skipif(True, reason='skip')", 0, id="skipif"),
+        pytest.param("@pytest.mark.filterwarnings('error')", 1, id="filterwarnings"),
+    ],
+)
+def test_result_cache_marks(
+    ipytest_entry_point, result_cache, capsys, mark, expected_exit_code
+):
+    source = "import pytest, warnings\n\n{mark}\ndef test_example():\n    warnings.warn('w')\n"
+
+    assert ipytest_entry_point("-v", "result_cache=True", source.format(mark="")) == 0
+    assert "test_example PASSED" in capsys.readouterr().out
+
+    exit_code = ipytest_entry_point("-v", "result_cache=True", source.format(mark=mark))
+    output = capsys.readouterr().out
+    assert exit_code == expected_exit_code
+    assert "CACHED" not in output
+
+
+def test_result_cache_local_module(
+    ipytest_entry_point, result_cache, tmp_path, monkeypatch, capsys
+):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    helpers = tmp_path / "ipytest_helpers.py"
+    source = (
+        "import ipytest_helpers\n"
+        "\n"
+        "def test_value():\n"
+        "    assert ipytest_helpers.value() == 1\n"
+    )
+
+    try:
+        helpers.write_text("def value():\n    return 1\n")
+        for _ in range(2):
+            assert ipytest_entry_point("-v", "result_cache=True", source) == 0
+
+        assert "test_value CACHED" in capsys.readouterr().out
+
+        helpers.write_text("def value():\n    return 21\n")
+        ipytest.force_reload("ipytest_helpers")
+
+        assert ipytest_entry_point("-v", "result_cache=True", source) == 1
+        assert "test_value FAILED" in capsys.readouterr().out
+
+    finally:
+        ipytest.force_reload("ipytest_helpers")
+
+
+def test_result_cache_clear(ipytest_entry_point, result_cache, capsys):
+    ipytest_entry_point("-v", "result_cache=True", module_source)
+    ipytest_entry_point("-v --cache-clear", "result_cache=True", module_source)
+
+    output = capsys.readouterr().out
+    assert "CACHED" not in output
+
+
+def test_result_cache_persistent(ipytest_entry_point, result_cache, capsys):
+    ipytest_entry_point("-v", "result_cache='persistent'", module_source)
+    ipytest._impl._result_cache_store.clear()
+    capsys.readouterr()
+
+    ipytest_entry_point("-v", "result_cache='persistent'", module_source)
+    assert "test_helper CACHED" in capsys.readouterr().out
+
+
+def test_unknown_result_cache_mode():
+    with pytest.raises(ValueError, match="Unknown result cache mode"):
+        ipytest.run(result_cache="unknown")
+
+
+def digest(source, name):
+    module = types.ModuleType("dummy_module")
+    exec(source, module.__dict__, module.__dict__)
+
+    h = hashlib.sha256()
+    DependencyHasher().update(h, getattr(module, name))
+    return h.hexdigest()
+
+
+def test_dependency_hasher_tracks_transitive_globals():
+    source = (
+        "VALUE = 1\ndef inner():\n    return VALUE\ndef outer():\n    return inner()\n"
+    )
+
+    assert digest(source, "outer") == digest(source, "outer")
+    assert digest(source, "outer") != digest(source.replace("1", "2"), "outer")
+    assert digest(source, "outer") != digest(
+        source.replace("return VALUE", "return VALUE + 0"), "outer"
+    )
+
+
+def test_dependency_hasher_ignores_line_numbers():
+    source = "def func():\n    return 1\n"
+    assert digest(source, "func") == digest("\n\n" + source, "func")
+
+
+def test_dependency_hasher_unhashable_globals():
+    module = types.ModuleType("dummy_module")
+    module.lock = threading.Lock()
+    exec("def func():\n    return lock\n", module.__dict__, module.__dict__)
+
+    with pytest.raises(UnhashableDependency):
+        DependencyHasher().update(hashlib.sha256(), module.func)
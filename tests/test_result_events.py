@@ -0,0 +1,95 @@
+import types
+
+import pytest
+
+import ipytest
+
+module_source = """
+import pytest
+
+@pytest.fixture
+def broken():
+    raise RuntimeError()
+
+def test_pass():
+    pass
+
+def test_fail():
+    assert False
+
+def test_error(broken):
+    pass
+
+@pytest.mark.skip
+def test_skip():
+    pass
+
+@pytest.mark.xfail
+def test_xfail():
+    assert False
+
+@pytest.mark.parametrize("value", [1, 2])
+def test_param(value):
+    pass
+"""
+
+
+def make_module(source):
+    module = types.ModuleType("dummy_module")
+    exec(compile(source, "<cell>", "exec"), module.__dict__, module.__dict__)
+    return module
+
+
+def test_result_events(scoped_config):
+    events = []
+    ipytest.run(
+        "-qq",
+        module=make_module(module_source),
+        plugins=[ipytest.ResultEvents(events.append)],
+    )
+
+    outcomes = {event.nodeid.partition("::")[2]: event.outcome for event in events}
+    assert outcomes == {
+        "test_pass": "passed",
+        "test_fail": "failed",
+        "test_error": "error",
+        "test_skip": "skipped",
+        "test_xfail": "xfailed",
+        "test_param[1]": "passed",
+        "test_param[2]": "passed",
+    }
+
+    assert all(isinstance(event, ipytest.ResultEvent) for event in events)
+    assert all(event.cell == "<cell>" for event in events)
+    assert all(event.duration >= 0 for event in events)
+
+
+def test_result_events_stop(scoped_config):
+    events = []
+
+    def on_result(event):
+        events.append(event)
+        return event.outcome == "failed"
+
+    exit_code = ipytest.run(
+        "-qq",
+        module=make_module(module_source),
+        plugins=[ipytest.ResultEvents(on_result)],
+    )
+
+    assert exit_code == 2
+    assert [event.outcome for event in events] == ["passed", "failed"]
+
+
+@pytest.mark.parametrize("parallel", [1, 2])
+def test_result_events_parallel(scoped_config, parallel):
+    events = []
+    ipytest.run(
+        "-qq",
+        module=make_module(module_source),
+        plugins=[ipytest.ResultEvents(events.append)],
+        parallel=parallel,
+    )
+
+    assert len(events) == 7
+    assert {event.cell for event in events} == {"<cell>"}
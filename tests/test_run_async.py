@@ -0,0 +1,128 @@
+import concurrent.futures
+import threading
+import types
+
+import pytest
+
+import ipytest
+import ipytest._impl
+
+module_source = """
+import threading
+
+def test_pass():
+    global thread_ident
+    thread_ident = threading.get_ident()
+"""
+
+failing_source = """
+def test_fail():
+    assert False
+"""
+
+
+def make_module(source):
+    module = types.ModuleType("dummy_module")
+    exec(source, module.__dict__, module.__dict__)
+    return module
+
+
+def test_run_async(scoped_config):
+    ipytest.exit_code = None
+    module = make_module(module_source)
+
+    future = ipytest.run_async(module=module)
+    assert isinstance(future, concurrent.futures.Future)
+
+    assert future.result(timeout=60) == 0
+    assert ipytest.exit_code == 0
+    assert module.thread_ident != threading.get_ident()
+
+
+def test_run_async_raise_on_error(scoped_config):
+    future = ipytest.run_async(module=make_module(failing_source), raise_on_error=True)
+
+    with pytest.raises(ipytest.Error):
+        future.result(timeout=60)
+
+    assert ipytest.exit_code == 1
+
+
+def test_run_async_does_not_support_run_in_thread():
+    with pytest.raises(TypeError):
+        ipytest.run_async(run_in_thread=True)
+
+
+def test_magic_background(scoped_config, mock_ipython):
+    module = types.ModuleType("dummy_module")
+    mock_ipython.module = module
+
+    future = ipytest._impl.ipytest_magic(
+        "", "# ipytest: background=True\n" + module_source, module=module
+    )
+
+    assert future.result(timeout=60) == 0
+    assert module.thread_ident != threading.get_ident()
+
+
+capture_source = """
+def test_capture(request):
+    global capture
+    capture = request.config.getoption("capture")
+"""
+
+
+@pytest.mark.parametrize(
+    ("args", "addopts", "expected"),
+    [
+        ((), (), "no"),
+        (("--capture=sys",), (), "sys"),
+        ((), ("--capture=sys",), "sys"),
+        ((), ("--capture", "sys"), "sys"),
+        (("-rs",), ("--capture=sys",), "sys"),
+    ],
+)
+def test_run_async_capture(scoped_config, args, addopts, expected):
+    ipytest.config(addopts=addopts)
+    module = make_module(capture_source)
+
+    assert ipytest.run_async(*args, module=module).result(timeout=60) == 0
+    assert module.capture == expected
+
+
+@pytest.mark.parametrize(
+    ("args", "expected"),
+    [
+        ((), False),
+        (("-s",), True),
+        (("-vs",), True),
+        (("--capture=fd",), True),
+        (("--capture", "fd"), True),
+        (("-rs",), False),
+        (("-k", "s"), False),
+        (("--", "-s"), False),
+    ],
+)
+def test_has_capture_option(args, expected):
+    assert ipytest._impl._has_capture_option(args) is expected
+
+
+def test_run_waits_for_background_runs(scoped_config):
+    events = []
+    slow_module = make_module(
+        "import time\n"
+        "def test_slow():\n"
+        "    events.append('slow-start')\n"
+        "    time.sleep(0.5)\n"
+        "    events.append('slow-end')\n"
+    )
+    slow_module.events = events
+
+    fast_module = make_module("def test_fast():\n    events.append('fast')\n")
+    fast_module.events = events
+
+    future = ipytest.run_async(module=slow_module)
+    assert ipytest.run(module=fast_module) == 0
+    assert future.result(timeout=60) == 0
+
+    assert events == ["slow-start", "slow-end", "fast"]
@@ -0,0 +1,123 @@
+import json
+import types
+
+import pytest
+
+import ipytest
+from ipytest._impl import _get_shard
+
+module_source = """
+import pytest
+
+@pytest.mark.parametrize("value", range(10))
+def test_example(value):
+    pass
+
+def test_other():
+    pass
+"""
+
+
+@pytest.fixture
+def shard_env(scoped_config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("IPYTEST_SHARD_INDEX", raising=False)
+    monkeypatch.delenv("IPYTEST_SHARD_COUNT", raising=False)
+
+
+def run_shard(*args, **kwargs):
+    module = types.ModuleType("dummy_module")
+    exec(module_source, module.__dict__, module.__dict__)
+
+    events = []
+    exit_code = ipytest.run(
+        "-qq",
+        *args,
+        module=module,
+        plugins=[ipytest.ResultEvents(events.append)],
+        **kwargs,
+    )
+    assert exit_code == 0
+
+    return {event.nodeid.partition("::")[2] for event in events}
+
+
+def test_shard_partition(shard_env):
+    # NOTE: without cache all shards see the same (missing) durations
+    shards = [
+        run_shard("-p", "no:cacheprovider", shard_index=index, shard_count=3)
+        for index in range(3)
+    ]
+
+    assert sum(len(shard) for shard in shards) == 11
+    assert set.union(*shards) == {f"test_example[{i}]" for i in range(10)} | {
+        "test_other"
+    }
+    assert all(3 <= len(shard) <= 4 for shard in shards)
+
+
+def test_shard_balanced_by_duration(shard_env, tmp_path):
+    # record the durations, with one test being very slow
+    run_shard(shard_count=1)
+
+    cache_path = tmp_path / ".pytest_cache" / "v" / "ipytest" / "durations"
+    assert cache_path.exists()
+
+    durations = json.loads(cache_path.read_text())
+    assert set(durations) == {f"test_example[{i}]" for i in range(10)} | {"test_other"}
+
+    durations["test_other"] = 100.0
+
+    # the slow test is placed on its own shard
+    shards = []
+    for index in range(2):
+        cache_path.write_text(json.dumps(durations))
+        shards.append(run_shard(shard_index=index, shard_count=2))
+
+    assert {"test_other"} in shards
+
+
+def test_shard_from_environment(shard_env, monkeypatch):
+    monkeypatch.setenv("IPYTEST_SHARD_INDEX", "1")
+    monkeypatch.setenv("IPYTEST_SHARD_COUNT", "11")
+
+    assert len(run_shard()) == 1
+
+
+def test_shard_empty(shard_env):
+    assert run_shard(shard_index=20, shard_count=21) == set()
+
+
+@pytest.mark.parametrize(
+    ("index", "count", "expected"),
+    [
+        pytest.param(None, None, None),
+        pytest.param(None, 2, (0, 2)),
+        pytest.param(1, "2", (1, 2)),
+    ],
+)
+def test_get_shard(monkeypatch, index, count, expected):
+    monkeypatch.delenv("IPYTEST_SHARD_INDEX", raising=False)
+    monkeypatch.delenv("IPYTEST_SHARD_COUNT", raising=False)
+    assert _get_shard(index, count) == expected
+
+
+@pytest.mark.parametrize(
+    ("index", "count"),
+    [(2, 2), (-1, 2), (0, 0), (1, None), ("one", 2), (0, "two")],
+)
+def test_get_shard_invalid(monkeypatch, index, count):
+    monkeypatch.delenv("IPYTEST_SHARD_INDEX", raising=False)
+    monkeypatch.delenv("IPYTEST_SHARD_COUNT", raising=False)
+    with pytest.raises(ValueError, match="Invalid shard"):
+        _get_shard(index, count)
+
+
+def test_get_shard_from_empty_environment(monkeypatch):
+    monkeypatch.setenv("IPYTEST_SHARD_INDEX", "")
+    monkeypatch.setenv("IPYTEST_SHARD_COUNT", "")
+    assert _get_shard(None, None) is None
+
+    monkeypatch.setenv("IPYTEST_SHARD_COUNT", "x")
+    with pytest.raises(ValueError, match="Invalid shard"):
+        _get_shard(None, None)
@@ -60,6 +60,15 @@ def test():
     _sh("uv run --group dev  -m pytest tests")
 
 
+@cmd()
+@arg("--output")
+def bench(output=None):
+    _sh(
+        "uv run --group dev python benchmarks/bench_ipytest.py",
+        f"--output {_q(output)}" if output is not None else "",
+    )
+
+
 @cmd()
 def integration():
     notebooks = [